@@ -0,0 +1,151 @@
+import csv
+import json
+import multiprocessing
+import os
+import sys
+from collections import Counter, defaultdict
+
+from graph import Graph, path_from_tree, reverse_path
+
+# Loaded before the pool forks, so every worker shares the same pages
+graph = None
+
+
+def main():
+    if len(sys.argv) not in [3, 4]:
+        sys.exit("Usage: python batch.py directory pairs.csv|pairs.jsonl [workers]")
+    directory = sys.argv[1]
+    workers = int(sys.argv[3]) if len(sys.argv) == 4 else os.cpu_count()
+
+    global graph
+    print("Loading data...", file=sys.stderr)
+    graph = Graph.load(directory)
+    print("Data loaded.", file=sys.stderr)
+
+    pairs = read_pairs(sys.argv[2])
+    groups, errors = group_pairs(pairs)
+    for result in errors:
+        emit(result)
+
+    # Biggest groups first, so a long BFS does not start last
+    groups = sorted(groups.items(), key=lambda group: len(group[1]), reverse=True)
+    print(f"{len(pairs)} pairs in {len(groups)} searches.", file=sys.stderr)
+
+    context = multiprocessing.get_context("fork")
+    with context.Pool(workers) as pool:
+        for results in pool.imap_unordered(solve_group, groups):
+            for result in results:
+                emit(result)
+
+
+def read_pairs(filename):
+    """
+    Read (line, source, target) pairs from a CSV file with a header or a
+    JSON Lines file. Each person is given either by name, under `source`
+    and `target`, or by IMDB id, under `source_id` and `target_id`.
+    """
+    if filename.endswith(".jsonl"):
+        with open(filename, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(filename, encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+
+    pairs = []
+    for line, row in enumerate(rows, 1):
+        pairs.append((
+            line,
+            ("id", row["source_id"]) if row.get("source_id") else ("name", row.get("source")),
+            ("id", row["target_id"]) if row.get("target_id") else ("name", row.get("target"))
+        ))
+    return pairs
+
+
+def resolve(person):
+    """
+    Returns the graph index for a ("id", id) or ("name", name) person.
+    Ambiguous names resolve to the person with the most movies, and names
+    with no exact match to the closest one.
+    Raises ValueError if it names nobody.
+    """
+    kind, value = person
+    if kind == "id":
+        index = graph.person_for_id(value)
+        if index is None:
+            raise ValueError(f"No person with id {value}")
+        return index
+    index = graph.name_index().best(value or "")
+    if index is None:
+        raise ValueError(f"No person named '{value}'")
+    return index
+
+
+def group_pairs(pairs):
+    """
+    Groups pairs by the endpoint that one BFS should be run from.
+    Since paths are undirected, each pair is rooted at whichever of its two
+    people appears in more pairs.
+    Returns ({root: [(line, source, target)]}, [error results]).
+    """
+    resolved = []
+    errors = []
+    for line, source, target in pairs:
+        try:
+            resolved.append((line, resolve(source), resolve(target)))
+        except ValueError as e:
+            errors.append({"line": line, "error": str(e)})
+
+    counts = Counter()
+    for _, source, target in resolved:
+        counts[source] += 1
+        counts[target] += 1
+
+    groups = defaultdict(list)
+    for line, source, target in resolved:
+        root = source if counts[source] >= counts[target] else target
+        groups[root].append((line, source, target))
+    return groups, errors
+
+
+def solve_group(group):
+    """
+    Returns results for every pair rooted at one person, running a single
+    BFS for all of them (or a bidirectional search for a lone pair).
+    """
+    root, pairs = group
+    if len(pairs) == 1:
+        line, source, target = pairs[0]
+        return [result(line, source, target, graph.shortest_path(source, target))]
+
+    tree = graph.bfs(root)
+    results = []
+    for line, source, target in pairs:
+        if source == root:
+            path = path_from_tree(tree, target)
+        else:
+            path = reverse_path(path_from_tree(tree, source), target)
+        results.append(result(line, source, target, path))
+    return results
+
+
+def result(line, source, target, path):
+    """
+    Returns the output record for one pair.
+    """
+    return {
+        "line": line,
+        "source_id": graph.person_ids[source],
+        "target_id": graph.person_ids[target],
+        "degrees": None if path is None else len(path),
+        "path": None if path is None else [
+            [graph.movie_ids[movie], graph.person_ids[person]] for movie, person in path
+        ]
+    }
+
+
+def emit(result):
+    print(json.dumps(result), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import csv
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from itertools import accumulate
+
+import degrees
+from graph import Graph
+
+# Sizes of the synthetic datasets to benchmark, in people
+SCALES = [2000, 20000]
+
+# Movies per person, and the shape of the power laws for cast sizes and
+# for how often each person is cast
+MOVIES_PER_PERSON = 0.5
+CAST_EXPONENT = 1.8
+POPULARITY_EXPONENT = 0.8
+MAX_CAST = 200
+
+# Pairs timed at each degree of separation, and people timed for neighbors
+PAIRS_PER_DISTANCE = 5
+NEIGHBOR_SAMPLES = 200
+MAX_DISTANCE = 8
+
+
+def main():
+    scales = [int(arg) for arg in sys.argv[1:]] or SCALES
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as directory:
+            generate(directory, scale, seed=scale)
+            for record in benchmark(directory, scale):
+                print(json.dumps(record), flush=True)
+
+
+def generate(directory, num_people, seed=0):
+    """
+    Write synthetic people.csv, movies.csv and stars.csv files to `directory`.
+    Cast sizes follow a power law, and a few people are cast far more often
+    than the rest, as in the IMDB data.
+    """
+    rng = random.Random(seed)
+    num_movies = max(1, int(num_people * MOVIES_PER_PERSON))
+
+    with open(os.path.join(directory, "people.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "name", "birth"])
+        for person in range(num_people):
+            writer.writerow([person, f"Person {person}", rng.randint(1920, 2010)])
+
+    with open(os.path.join(directory, "movies.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "title", "year"])
+        for movie in range(num_movies):
+            writer.writerow([movie, f"Movie {movie}", rng.randint(1930, 2020)])
+
+    # Zipf-like popularity: the person of rank r is cast about r^-a as often
+    popularity = list(accumulate(
+        (rank + 1) ** -POPULARITY_EXPONENT for rank in range(num_people)
+    ))
+    with open(os.path.join(directory, "stars.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["person_id", "movie_id"])
+        for movie in range(num_movies):
+            cast_size = min(MAX_CAST, num_people, int(rng.paretovariate(CAST_EXPONENT)) + 1)
+            cast = set(rng.choices(range(num_people), cum_weights=popularity, k=cast_size))
+            for person in cast:
+                writer.writerow([person, movie])
+
+
+def benchmark(directory, scale):
+    """
+    Yield one record per measurement on the dataset in `directory`.
+    """
+    with open(os.path.join(directory, "stars.csv"), encoding="utf-8") as f:
+        stars = sum(1 for _ in f) - 1
+    base = {"scale": scale, "stars": stars}
+
+    # Loading
+    seconds, peak = measure(lambda: load_dicts(directory))
+    yield dict(base, benchmark="load_data", seconds=seconds, peak_bytes=peak)
+    seconds, peak = measure(lambda: Graph.load(directory, snapshot=False))
+    yield dict(base, benchmark="Graph.from_csv", seconds=seconds, peak_bytes=peak)
+    # Loading through the snapshot writes it for the next measurement
+    Graph.load(directory)
+    seconds, peak = measure(lambda: Graph.open_snapshot(directory))
+    yield dict(base, benchmark="Graph.open_snapshot", seconds=seconds, peak_bytes=peak)
+
+    load_dicts(directory)
+    graph = Graph.load(directory)
+    rng = random.Random(scale)
+
+    # Neighbors
+    sample = rng.sample(list(degrees.people), min(NEIGHBOR_SAMPLES, len(degrees.people)))
+    seconds, _ = measure(lambda: [degrees.neighbors_for_person(p) for p in sample], memory=False)
+    yield dict(base, benchmark="neighbors_for_person", calls=len(sample), seconds=seconds)
+    indices = [graph.person_for_id(p) for p in sample]
+    seconds, _ = measure(lambda: [graph.neighbors_for_person(p) for p in indices], memory=False)
+    yield dict(base, benchmark="Graph.neighbors_for_person", calls=len(sample), seconds=seconds)
+
+    # Searches, grouped by how far apart the two people are
+    for distance, pairs in pairs_by_distance(graph, rng).items():
+        ids = [(graph.person_ids[s], graph.person_ids[t]) for s, t in pairs]
+        searches = [
+            ("shortest_path", degrees, "neighbors_for_person",
+             lambda: [degrees.shortest_path(s, t) for s, t in ids]),
+            ("bidirectional_path", degrees, "expand_layer",
+             lambda: [degrees.bidirectional_path(s, t) for s, t in ids]),
+            ("Graph.shortest_path", graph, "_expand_layer",
+             lambda: [graph.shortest_path(s, t) for s, t in pairs]),
+            ("Graph.shortest_path(bipartite=False)", graph, "_expand_layer",
+             lambda: [graph.shortest_path(s, t, bipartite=False) for s, t in pairs]),
+        ]
+        for name, owner, expander, run in searches:
+            expanded = count_expansions(owner, expander, run)
+            seconds, peak = measure(run)
+            yield dict(
+                base, benchmark=name, distance=distance, pairs=len(pairs),
+                seconds=seconds, peak_bytes=peak, nodes_expanded=expanded
+            )
+
+
+def load_dicts(directory):
+    """
+    Run `degrees.load_data` from scratch.
+    """
+    degrees.names.clear()
+    degrees.people.clear()
+    degrees.movies.clear()
+    degrees.load_data(directory)
+
+
+def measure(run, memory=True):
+    """
+    Returns the wall time of `run()` and, if `memory`, the peak memory it
+    allocated, from a second, traced run so tracing does not skew the time.
+    """
+    gc.collect()
+    start = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - start
+    if not memory:
+        return seconds, None
+
+    gc.collect()
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def count_expansions(owner, name, run):
+    """
+    Returns how many people `run()` expands, by wrapping the function
+    (or method) `name` of `owner` that its search expands people with.
+    """
+    original = getattr(owner, name)
+    count = 0
+
+    def counting(*args):
+        nonlocal count
+        # Layer expanders take a list of people, the rest take one person
+        count += len(args[0]) if isinstance(args[0], list) else 1
+        return original(*args)
+
+    setattr(owner, name, counting)
+    try:
+        run()
+    finally:
+        if owner is degrees:
+            setattr(owner, name, original)
+        else:
+            delattr(owner, name)
+    return count
+
+
+def pairs_by_distance(graph, rng):
+    """
+    Returns {distance: [(source, target)]} with a few pairs of people at
+    each degree of separation, found by BFS from random sources.
+    """
+    pairs = {}
+    for _ in range(20):
+        source = rng.randrange(graph.num_people)
+        distances = graph.bfs(source)[0]
+        by_distance = {}
+        for person, distance in enumerate(distances):
+            if 0 < distance <= MAX_DISTANCE:
+                by_distance.setdefault(distance, []).append(person)
+        for distance, people in by_distance.items():
+            found = pairs.setdefault(distance, [])
+            while len(found) < PAIRS_PER_DISTANCE and people:
+                found.append((source, people.pop(rng.randrange(len(people)))))
+    return dict(sorted(pairs.items()))
+
+
+if __name__ == "__main__":
+    main()
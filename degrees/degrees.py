@@ -1,6 +1,8 @@
 import csv
 import sys
 
+from graph import Graph, join_paths
+from lookup import NameIndex
 from util import Node, StackFrontier, QueueFrontier
 
 # Maps names to a set of corresponding person_ids
@@ -12,11 +14,20 @@ people = {}
 # Maps movie_ids to a dictionary of: title, year, stars (a set of person_ids)
 movies = {}
 
+# Prefix and fuzzy lookup over names, ranked by number of movies,
+# built on first use by `get_name_index`
+name_index = None
+
+# Compact integer-indexed graph, used instead of the dicts above with --compact
+graph = None
+
 
 def load_data(directory):
     """
     Load data from CSV files into memory.
     """
+    global name_index
+
     # Load people
     with open(f"{directory}/people.csv", encoding="utf-8") as f:
         reader = csv.DictReader(f)
@@ -51,11 +62,21 @@ def load_data(directory):
             except KeyError:
                 pass
 
+    # The name index, if built, no longer matches the data
+    name_index = None
+
 
 def main():
-    if len(sys.argv) > 2:
-        sys.exit("Usage: python degrees.py [directory]")
-    directory = sys.argv[1] if len(sys.argv) == 2 else "large"
+    args = sys.argv[1:]
+    compact = "--compact" in args
+    if compact:
+        args.remove("--compact")
+    if len(args) > 1:
+        sys.exit("Usage: python degrees.py [--compact] [directory]")
+    directory = args[0] if len(args) == 1 else "large"
+
+    if compact:
+        return main_compact(directory)
 
     # Load data from files into memory
     print("Loading data...")
@@ -69,7 +90,7 @@ def main():
     if target is None:
         sys.exit("Person not found.")
 
-    path = shortest_path(source, target)
+    path = bidirectional_path(source, target)
 
     if path is None:
         print("Not connected.")
@@ -84,6 +105,38 @@ def main():
             print(f"{i + 1}: {person1} and {person2} starred in {movie}")
 
 
+def main_compact(directory):
+    """
+    Same as `main`, but searches the compact integer-indexed graph.
+    """
+    global graph
+
+    print("Loading data...")
+    graph = Graph.load(directory)
+    print("Data loaded.")
+
+    source = person_for_name(input("Name: "))
+    if source is None:
+        sys.exit("Person not found.")
+    target = person_for_name(input("Name: "))
+    if target is None:
+        sys.exit("Person not found.")
+
+    path = graph.shortest_path(source, target)
+
+    if path is None:
+        print("Not connected.")
+    else:
+        degrees = len(path)
+        print(f"{degrees} degrees of separation.")
+        path = [(None, source)] + path
+        for i in range(degrees):
+            person1 = graph.person_names[path[i][1]]
+            person2 = graph.person_names[path[i + 1][1]]
+            movie = graph.movie_titles[path[i + 1][0]]
+            print(f"{i + 1}: {person1} and {person2} starred in {movie}")
+
+
 def shortest_path(source, target):
     # Initialize frontier to starting state
     start = Node(state=source, parent=None, action=None)
@@ -129,11 +182,88 @@ def shortest_path(source, target):
                 frontier.add(child)
 
 
-def person_id_for_name(name):
+def bidirectional_path(source, target):
+    """
+    Returns the same shortest list of (movie_id, person_id) pairs as
+    `shortest_path`, but grows one frontier from the source and one from
+    the target, always expanding a whole layer of the smaller frontier,
+    and stops as soon as the two searches meet.
+    """
+    if source == target:
+        return []
+
+    # Each side maps a person to the (movie_id, person_id) they were reached by
+    forward = {source: None}
+    backward = {target: None}
+    forward_layer = [source]
+    backward_layer = [target]
+
+    # Movies whose stars each side has already scanned
+    forward_movies = set()
+    backward_movies = set()
+
+    while forward_layer and backward_layer:
+        # Expanding the smaller layer keeps both searches as shallow as possible
+        if len(forward_layer) <= len(backward_layer):
+            forward_layer, meeting = expand_layer(forward_layer, forward, backward, forward_movies)
+        else:
+            backward_layer, meeting = expand_layer(backward_layer, backward, forward, backward_movies)
+        if meeting is not None:
+            return join_paths(forward, backward, meeting)
+
+    # One side ran out of people to visit, so the two are not connected
+    return None
+
+
+def expand_layer(layer, visited, other, seen_movies):
+    """
+    Expands every person in `layer`, recording parents in `visited`.
+    Movies are treated as nodes of the search: each one in `seen_movies`
+    has had its stars scanned already and is skipped.
+    Returns the next layer and the first person also reached by the
+    `other` search, or None if the searches have not met yet.
+    """
+    next_layer = []
+    for person_id in layer:
+        for movie_id in people[person_id]["movies"]:
+            if movie_id in seen_movies:
+                continue
+            seen_movies.add(movie_id)
+            for neighbor in movies[movie_id]["stars"]:
+                if neighbor in visited:
+                    continue
+                visited[neighbor] = (movie_id, person_id)
+                if neighbor in other:
+                    return next_layer, neighbor
+                next_layer.append(neighbor)
+    return next_layer, None
+
+
+def get_name_index():
+    """
+    Returns the prefix and fuzzy name index over `people`, building it on
+    first use, so loading does not pay for it unless it is needed.
+    """
+    global name_index
+    if name_index is None:
+        name_index = NameIndex(
+            (person["name"], person_id, len(person["movies"]))
+            for person_id, person in people.items()
+        )
+    return name_index
+
+
+def person_id_for_name(name, interactive=True):
     """
     Returns the IMDB id for a person's name,
     resolving ambiguities as needed.
+
+    When not `interactive`, ambiguities are resolved without asking by
+    picking the person with the most movies, and a name with no exact match
+    falls back to the closest approximate match.
     """
+    if not interactive:
+        return get_name_index().best(name)
     person_ids = list(names.get(name.lower(), set()))
     if len(person_ids) == 0:
         return None
@@ -155,6 +285,32 @@ def person_id_for_name(name):
         return person_ids[0]
 
 
+def person_for_name(name):
+    """
+    Returns the compact graph index for a person's name,
+    resolving ambiguities as needed.
+    """
+    candidates = graph.people_named(name)
+    if len(candidates) == 0:
+        return None
+    elif len(candidates) > 1:
+        print(f"Which '{name}'?")
+        for person in candidates:
+            person_id = graph.person_ids[person]
+            name = graph.person_names[person]
+            birth = graph.person_births[person]
+            print(f"ID: {person_id}, Name: {name}, Birth: {birth}")
+        try:
+            person = graph.person_for_id(input("Intended Person ID: "))
+            if person in candidates:
+                return person
+        except ValueError:
+            pass
+        return None
+    else:
+        return candidates[0]
+
+
 def neighbors_for_person(person_id):
     """
     Returns (movie_id, person_id) pairs for people
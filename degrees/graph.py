@@ -0,0 +1,664 @@
+import csv
+import json
+import mmap
+import os
+from array import array
+from bisect import bisect_left
+
+from lookup import NameIndex
+
+# Snapshot of the loaded graph, saved next to the CSV files it was built from
+SNAPSHOT = "graph.snapshot"
+SNAPSHOT_MAGIC = b"DEGREES1"
+SOURCES = ["people.csv", "movies.csv", "stars.csv"]
+
+# People, movies and star rows added since the CSV files were written,
+# one JSON object per line, replayed on top of the snapshot at load time
+JOURNAL = "graph.journal"
+
+# Tables stored in a snapshot, in file order
+STRING_TABLES = [
+    "person_ids", "person_names", "person_births",
+    "movie_ids", "movie_titles", "movie_years"
+]
+INDEX_TABLES = [
+    "person_offsets", "person_movies", "movie_offsets", "movie_stars",
+    "name_order", "id_order"
+]
+
+
+class Graph():
+    """
+    Compact person/movie graph for the degrees dataset.
+
+    People and movies are interned to dense integers in CSV order, and the
+    person <-> movie adjacency is held in CSR-style offset and index arrays,
+    so the graph costs a few machine words per star row instead of a dict
+    and a set per person and movie. Search works entirely on the integer
+    indices; names and titles are only looked up for printing.
+    """
+
+    def __init__(self, person_ids, person_names, person_births,
+                 movie_ids, movie_titles, movie_years,
+                 person_offsets, person_movies, movie_offsets, movie_stars):
+        self.person_ids = person_ids
+        self.person_names = person_names
+        self.person_births = person_births
+        self.movie_ids = movie_ids
+        self.movie_titles = movie_titles
+        self.movie_years = movie_years
+
+        # Movies of person p are person_movies[person_offsets[p]:person_offsets[p + 1]]
+        self.person_offsets = person_offsets
+        self.person_movies = person_movies
+
+        # Stars of movie m are movie_stars[movie_offsets[m]:movie_offsets[m + 1]]
+        self.movie_offsets = movie_offsets
+        self.movie_stars = movie_stars
+
+        # Person indices sorted by lowercase name and by IMDB id, for bisection.
+        # Only snapshots carry these; graphs parsed from CSV use dicts instead.
+        self.name_order = None
+        self.id_order = None
+
+        # Rows added after loading. People and movies get the next free
+        # indices, and their star rows are kept beside the CSR arrays
+        self.base_people = len(person_offsets) - 1
+        self.base_movies = len(movie_offsets) - 1
+        self.extra_movies = {}
+        self.extra_stars = {}
+        self.extra_ids = {}
+        self.extra_names = {}
+        self.journal = None
+
+        # Number of rows applied on top of the CSV files or snapshot
+        self.updates = 0
+
+        self._person_index = None
+        self._movie_index = None
+        self._names = None
+        self._name_index = None
+        self._mmap = None
+
+    @classmethod
+    def load(cls, directory, snapshot=True):
+        """
+        Load the graph for `directory`, from its snapshot if that is still
+        up to date, otherwise from the CSV files (saving a fresh snapshot),
+        then replay any updates recorded in its journal.
+        """
+        graph = cls.open_snapshot(directory) if snapshot else None
+        if graph is None:
+            graph = cls.from_csv(directory)
+            if snapshot:
+                try:
+                    graph.save_snapshot(directory)
+                except OSError:
+                    # A read-only dataset just means no snapshot next time
+                    pass
+
+        path = os.path.join(directory, JOURNAL)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        graph.apply(json.loads(line))
+        graph.journal = path
+        return graph
+
+    @classmethod
+    def open_snapshot(cls, directory):
+        """
+        Memory-map the snapshot in `directory`.
+        Returns None if there is no snapshot or the CSV files have changed
+        since it was written.
+        """
+        try:
+            f = open(os.path.join(directory, SNAPSHOT), "rb")
+        except FileNotFoundError:
+            return None
+        with f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                return None
+            header_size = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(header_size))
+            if header["sources"] != source_stamps(directory):
+                return None
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(mapped)
+        tables = {}
+        for name, (offset, size) in header["tables"].items():
+            table = view[offset:offset + size]
+            tables[name] = table if name.endswith("_data") else table.cast("q")
+        for name in STRING_TABLES:
+            tables[name] = StringTable(tables.pop(name + "_offsets"), tables.pop(name + "_data"))
+
+        graph = cls(*(tables[name] for name in STRING_TABLES + INDEX_TABLES[:4]))
+        graph.name_order = tables["name_order"]
+        graph.id_order = tables["id_order"]
+        graph._mmap = mapped
+        return graph
+
+    def save_snapshot(self, directory):
+        """
+        Write the graph, with name and id indices, to a snapshot in `directory`
+        stamped with the current sizes and mtimes of the CSV files.
+        """
+        if self.updates:
+            raise ValueError("Updates belong in the journal, not the snapshot")
+        tables = {}
+        for name in STRING_TABLES:
+            offsets, data = encode_strings(getattr(self, name))
+            tables[name + "_offsets"] = offsets
+            tables[name + "_data"] = data
+        for name in INDEX_TABLES[:4]:
+            tables[name] = array("q", getattr(self, name))
+        tables["name_order"] = array("q", sorted(
+            range(self.num_people), key=lambda person: self.person_names[person].lower()
+        ))
+        tables["id_order"] = array("q", sorted(
+            range(self.num_people), key=lambda person: self.person_ids[person]
+        ))
+
+        # Lay the tables out back to back, 8-byte aligned, after a header
+        # padded until it is large enough to hold its own offsets
+        sources = source_stamps(directory)
+        start = 0
+        while True:
+            layout = {}
+            offset = start
+            for name, table in tables.items():
+                size = len(table) * table.itemsize
+                layout[name] = [offset, size]
+                offset += size + (-size % 8)
+            encoded = json.dumps({"sources": sources, "tables": layout}).encode()
+            needed = len(SNAPSHOT_MAGIC) + 8 + len(encoded)
+            needed += -needed % 8
+            if needed <= start:
+                break
+            start = needed
+        encoded = encoded.ljust(start - len(SNAPSHOT_MAGIC) - 8)
+
+        path = os.path.join(directory, SNAPSHOT)
+        with open(path + ".tmp", "wb") as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(len(encoded).to_bytes(8, "little"))
+            f.write(encoded)
+            for name, table in tables.items():
+                f.seek(layout[name][0])
+                f.write(table.tobytes())
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def from_csv(cls, directory):
+        """
+        Build a graph from the people, movies and stars CSV files.
+        """
+        person_index = {}
+        person_ids, person_names, person_births = [], [], []
+        with open(f"{directory}/people.csv", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                person_index[row["id"]] = len(person_ids)
+                person_ids.append(row["id"])
+                person_names.append(row["name"])
+                person_births.append(row["birth"])
+
+        movie_index = {}
+        movie_ids, movie_titles, movie_years = [], [], []
+        with open(f"{directory}/movies.csv", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                movie_index[row["id"]] = len(movie_ids)
+                movie_ids.append(row["id"])
+                movie_titles.append(row["title"])
+                movie_years.append(row["year"])
+
+        # Keep star rows as two parallel integer columns until we know the degrees
+        star_people = array("l")
+        star_movies = array("l")
+        with open(f"{directory}/stars.csv", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                person = person_index.get(row["person_id"])
+                movie = movie_index.get(row["movie_id"])
+                if person is None or movie is None:
+                    continue
+                star_people.append(person)
+                star_movies.append(movie)
+
+        person_offsets, person_movies = build_csr(len(person_ids), star_people, star_movies)
+        movie_offsets, movie_stars = build_csr(len(movie_ids), star_movies, star_people)
+
+        graph = cls(
+            person_ids, person_names, person_births,
+            movie_ids, movie_titles, movie_years,
+            person_offsets, person_movies, movie_offsets, movie_stars
+        )
+        graph._person_index = person_index
+        graph._movie_index = movie_index
+        return graph
+
+    @property
+    def num_people(self):
+        return len(self.person_ids)
+
+    @property
+    def num_movies(self):
+        return len(self.movie_ids)
+
+    def add_person(self, person_id, name, birth):
+        """
+        Add a person and return their index (or the index they already had).
+        """
+        person = self.person_for_id(person_id)
+        if person is None:
+            person = self.apply({"person": person_id, "name": name, "birth": birth})
+            self.record({"person": person_id, "name": name, "birth": birth})
+        return person
+
+    def add_movie(self, movie_id, title, year):
+        """
+        Add a movie and return its index (or the index it already had).
+        """
+        movie = self.movie_for_id(movie_id)
+        if movie is None:
+            movie = self.apply({"movie": movie_id, "title": title, "year": year})
+            self.record({"movie": movie_id, "title": title, "year": year})
+        return movie
+
+    def add_star(self, person_id, movie_id):
+        """
+        Record that a person starred in a movie, both given by IMDB id.
+        Returns the (person, movie) indices, or None if the row was already
+        known. Raises KeyError if either of them is unknown.
+        """
+        row = {"person_id": person_id, "movie_id": movie_id}
+        added = self.apply(row)
+        if added is not None:
+            self.record(row)
+        return added
+
+    def apply(self, row):
+        """
+        Apply one journal row to the graph in memory, skipping rows it
+        already contains. Returns what the matching add_ method returns.
+        """
+        if "person" in row:
+            person = self.person_for_id(row["person"])
+            if person is not None:
+                return person
+            self.person_ids = extended(self.person_ids)
+            self.person_names = extended(self.person_names)
+            self.person_births = extended(self.person_births)
+            person = self.num_people
+            self.person_ids.append(row["person"])
+            self.person_names.append(row["name"])
+            self.person_births.append(row["birth"])
+            self.extra_ids[row["person"]] = person
+            self.extra_names.setdefault(row["name"].lower(), []).append(person)
+            if self._name_index is not None:
+                self._name_index.add(row["name"], person, 0)
+            self.updates += 1
+            return person
+
+        if "movie" in row:
+            movie = self.movie_for_id(row["movie"])
+            if movie is not None:
+                return movie
+            self.movie_ids = extended(self.movie_ids)
+            self.movie_titles = extended(self.movie_titles)
+            self.movie_years = extended(self.movie_years)
+            movie = self.num_movies
+            self.movie_ids.append(row["movie"])
+            self.movie_titles.append(row["title"])
+            self.movie_years.append(row["year"])
+            self._movie_index[row["movie"]] = movie
+            self.updates += 1
+            return movie
+
+        person = self.person_for_id(row["person_id"])
+        movie = self.movie_for_id(row["movie_id"])
+        if person is None:
+            raise KeyError(f"Unknown person {row['person_id']}")
+        if movie is None:
+            raise KeyError(f"Unknown movie {row['movie_id']}")
+        if person in self.stars_for_movie(movie):
+            return None
+        self.extra_movies.setdefault(person, []).append(movie)
+        self.extra_stars.setdefault(movie, []).append(person)
+        self.updates += 1
+        return person, movie
+
+    def record(self, row):
+        """
+        Append a row to the journal, if this graph was loaded from a directory.
+        """
+        if self.journal is not None:
+            with open(self.journal, "a", encoding="utf-8") as f:
+                f.write(json.dumps(row) + "\n")
+
+    def person_for_id(self, person_id):
+        """
+        Returns the index of the person with IMDB id `person_id`, or None.
+        """
+        if person_id in self.extra_ids:
+            return self.extra_ids[person_id]
+        if self.id_order is not None:
+            matches = bisect_equal(self.id_order, person_id, self.person_ids.__getitem__)
+            return matches[0] if matches else None
+        if self._person_index is None:
+            self._person_index = {
+                self.person_ids[person]: person for person in range(self.base_people)
+            }
+        return self._person_index.get(person_id)
+
+    def movie_for_id(self, movie_id):
+        """
+        Returns the index of the movie with IMDB id `movie_id`, or None.
+        """
+        if self._movie_index is None:
+            self._movie_index = {
+                movie_id: movie for movie, movie_id in enumerate(self.movie_ids)
+            }
+        return self._movie_index.get(movie_id)
+
+    def people_named(self, name):
+        """
+        Returns the indices of every person whose name matches `name`,
+        ignoring case.
+        """
+        extra = self.extra_names.get(name.lower(), [])
+        if self.name_order is not None:
+            return bisect_equal(
+                self.name_order, name.lower(), lambda person: self.person_names[person].lower()
+            ) + extra
+        if self._names is None:
+            self._names = {}
+            for person in range(self.base_people):
+                self._names.setdefault(self.person_names[person].lower(), []).append(person)
+        return self._names.get(name.lower(), []) + extra
+
+    def name_index(self):
+        """
+        Returns the prefix and fuzzy name index, building it on first use
+        and ranking people by their number of movies.
+        """
+        if self._name_index is None:
+            self._name_index = NameIndex(
+                (self.person_names[person], person, len(self.movies_for_person(person)))
+                for person in range(self.num_people)
+            )
+        return self._name_index
+
+    def movies_for_person(self, person):
+        if person < self.base_people:
+            movies = self.person_movies[self.person_offsets[person]:self.person_offsets[person + 1]]
+        else:
+            movies = ()
+        extra = self.extra_movies.get(person)
+        return movies if extra is None else [*movies, *extra]
+
+    def stars_for_movie(self, movie):
+        if movie < self.base_movies:
+            stars = self.movie_stars[self.movie_offsets[movie]:self.movie_offsets[movie + 1]]
+        else:
+            stars = ()
+        extra = self.extra_stars.get(movie)
+        return stars if extra is None else [*stars, *extra]
+
+    def neighbors_for_person(self, person):
+        """
+        Returns (movie, person) index pairs for people
+        who starred with a given person.
+        """
+        neighbors = set()
+        for movie in self.movies_for_person(person):
+            for star in self.stars_for_movie(movie):
+                neighbors.add((movie, star))
+        return neighbors
+
+    def shortest_path(self, source, target, bipartite=True):
+        """
+        Returns the shortest list of (movie, person) index pairs that
+        connect the source to the target, or None if they are not connected.
+
+        Uses the same layer-at-a-time bidirectional search as
+        `degrees.bidirectional_path`. With `bipartite`, movies are nodes
+        of the search too: each movie is marked once per side, so its star
+        list is scanned at most once instead of once per co-star reaching it,
+        and no neighbor sets are built.
+        """
+        if source == target:
+            return []
+
+        forward = {source: None}
+        backward = {target: None}
+        forward_layer = [source]
+        backward_layer = [target]
+        forward_movies = set()
+        backward_movies = set()
+
+        while forward_layer and backward_layer:
+            if len(forward_layer) <= len(backward_layer):
+                forward_layer, meeting = self._expand_layer(
+                    forward_layer, forward, backward, forward_movies if bipartite else None
+                )
+            else:
+                backward_layer, meeting = self._expand_layer(
+                    backward_layer, backward, forward, backward_movies if bipartite else None
+                )
+            if meeting is not None:
+                return join_paths(forward, backward, meeting)
+        return None
+
+    def _expand_layer(self, layer, visited, other, seen_movies):
+        next_layer = []
+        for person in layer:
+            if seen_movies is None:
+                neighbors = self.neighbors_for_person(person)
+            else:
+                neighbors = self._unseen_costars(person, seen_movies)
+            for (movie, neighbor) in neighbors:
+                if neighbor in visited:
+                    continue
+                visited[neighbor] = (movie, person)
+                if neighbor in other:
+                    return next_layer, neighbor
+                next_layer.append(neighbor)
+        return next_layer, None
+
+    def _unseen_costars(self, person, seen_movies):
+        """
+        Yields (movie, star) pairs for the movies of `person` that are not
+        yet in `seen_movies`, marking each movie as seen.
+        """
+        for movie in self.movies_for_person(person):
+            if movie in seen_movies:
+                continue
+            seen_movies.add(movie)
+            for star in self.stars_for_movie(movie):
+                yield movie, star
+
+    def bfs(self, source):
+        """
+        Runs a bipartite breadth-first search over the whole component of
+        `source`. Returns (distances, parents, via) arrays indexed by person:
+        the degrees of separation (-1 if unreachable), the previous person on
+        a shortest path, and the movie they share (both -1 for the source).
+        """
+        distances = array("l", [-1]) * self.num_people
+        parents = array("l", [-1]) * self.num_people
+        via = array("l", [-1]) * self.num_people
+        seen_movies = bytearray(self.num_movies)
+
+        distances[source] = 0
+        layer = [source]
+        depth = 0
+        while layer:
+            depth += 1
+            next_layer = []
+            for person in layer:
+                for movie in self.movies_for_person(person):
+                    if seen_movies[movie]:
+                        continue
+                    seen_movies[movie] = 1
+                    for star in self.stars_for_movie(movie):
+                        if distances[star] == -1:
+                            distances[star] = depth
+                            parents[star] = person
+                            via[star] = movie
+                            next_layer.append(star)
+            layer = next_layer
+        return distances, parents, via
+
+
+class Extended():
+    """
+    Sequence made of a read-only base sequence plus items appended to it.
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.items = []
+
+    def __len__(self):
+        return len(self.base) + len(self.items)
+
+    def __getitem__(self, i):
+        if i < len(self.base):
+            return self.base[i]
+        return self.items[i - len(self.base)]
+
+    def append(self, item):
+        self.items.append(item)
+
+
+def extended(sequence):
+    """
+    Returns `sequence` wrapped so that it can be appended to.
+    """
+    return sequence if isinstance(sequence, Extended) else Extended(sequence)
+
+
+class StringTable():
+    """
+    Read-only sequence of strings stored as one UTF-8 buffer plus offsets,
+    decoded only when an item is asked for.
+    """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+
+def encode_strings(strings):
+    """
+    Returns (offsets, data) arrays holding `strings` as UTF-8.
+    """
+    offsets = array("q", [0])
+    data = bytearray()
+    for string in strings:
+        data += string.encode("utf-8")
+        offsets.append(len(data))
+    return offsets, array("B", data)
+
+
+def source_stamps(directory):
+    """
+    Returns the size and mtime of each CSV file a snapshot is built from.
+    """
+    stamps = {}
+    for name in SOURCES:
+        stat = os.stat(os.path.join(directory, name))
+        stamps[name] = [stat.st_size, stat.st_mtime_ns]
+    return stamps
+
+
+def bisect_equal(order, value, key):
+    """
+    Returns the items of `order`, which is sorted by `key`, whose key is `value`.
+    """
+    matches = []
+    i = bisect_left(order, value, key=key)
+    while i < len(order) and key(order[i]) == value:
+        matches.append(order[i])
+        i += 1
+    return matches
+
+
+def build_csr(size, sources, targets):
+    """
+    Groups `targets` by `sources` with a counting sort.
+    Returns (offsets, indices) arrays so that the targets of source i are
+    indices[offsets[i]:offsets[i + 1]].
+    """
+    offsets = array("l", bytes(array("l").itemsize * (size + 1)))
+    for source in sources:
+        offsets[source + 1] += 1
+    for i in range(size):
+        offsets[i + 1] += offsets[i]
+
+    indices = array("l", bytes(array("l").itemsize * len(targets)))
+    cursor = array("l", offsets[:-1])
+    for source, target in zip(sources, targets):
+        indices[cursor[source]] = target
+        cursor[source] += 1
+    return offsets, indices
+
+
+def path_from_tree(tree, target):
+    """
+    Returns the list of (movie, person) pairs leading to `target` in the
+    search tree returned by `Graph.bfs`, or None if it was not reached.
+    """
+    distances, parents, via = tree
+    # People added after the search ran cannot have been reached by it
+    if target >= len(distances) or distances[target] == -1:
+        return None
+    path = []
+    person = target
+    while parents[person] != -1:
+        path.append((via[person], person))
+        person = parents[person]
+    path.reverse()
+    return path
+
+
+def reverse_path(path, target):
+    """
+    Reverses a path of (movie, person) pairs that starts at `target`,
+    so that it ends there instead.
+    """
+    if path is None:
+        return None
+    people = [target] + [person for _, person in path]
+    steps = []
+    for i in range(len(path) - 1, -1, -1):
+        steps.append((path[i][0], people[i]))
+    return steps
+
+
+def join_paths(forward, backward, meeting):
+    """
+    Stitches forward and backward parent maps together at `meeting`
+    into a source-to-target list of (movie, person) pairs.
+    """
+    path = []
+    person = meeting
+    while forward[person] is not None:
+        movie, parent = forward[person]
+        path.append((movie, person))
+        person = parent
+    path.reverse()
+
+    person = meeting
+    while backward[person] is not None:
+        movie, child = backward[person]
+        path.append((movie, child))
+        person = child
+    return path
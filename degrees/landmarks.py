@@ -0,0 +1,162 @@
+import json
+import math
+import mmap
+import os
+import sys
+import time
+from array import array
+
+from graph import Graph, source_stamps
+
+# Distance tables, saved next to the CSV files of the graph they describe
+LANDMARKS = "landmarks.bin"
+LANDMARKS_MAGIC = b"LANDMRK1"
+
+# Distances are stored in one signed byte each
+UNREACHABLE = -1
+
+
+class Landmarks():
+    """
+    Distance oracle for approximate degrees of separation.
+
+    Stores the BFS distance from a few well-connected landmark people to
+    everyone else. By the triangle inequality, for any landmark L,
+    |d(L, s) - d(L, t)| <= d(s, t) <= d(L, s) + d(L, t), so taking the
+    best of each over all landmarks bounds d(s, t) without any search.
+    """
+
+    def __init__(self, people, distances, updates=0):
+        # Landmark person indices, and one distance table per landmark
+        self.people = people
+        self.distances = distances
+
+        # Journal rows the graph had applied when the tables were computed
+        self.updates = updates
+
+    @classmethod
+    def build(cls, graph, count=16):
+        """
+        Pick `count` landmarks among the people with the most co-star slots,
+        skipping anyone right next to a landmark already chosen,
+        and run a BFS from each.
+        """
+        def degree(person):
+            return sum(len(graph.stars_for_movie(movie)) for movie in graph.movies_for_person(person))
+
+        candidates = sorted(range(graph.num_people), key=degree, reverse=True)
+        people = []
+        distances = []
+        for person in candidates:
+            if len(people) == count:
+                break
+            if any(0 <= table[person] <= 1 for table in distances):
+                continue
+            tree_distances = graph.bfs(person)[0]
+            people.append(person)
+            distances.append(array("b", (
+                min(distance, 127) for distance in tree_distances
+            )))
+        return cls(people, distances, graph.updates)
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Memory-map the landmark tables saved in `directory`.
+        Returns None if there are none, or if the CSV files have changed
+        since they were computed. Callers should also compare `updates`
+        with the graph's, since journal rows do not touch the CSV files.
+        """
+        try:
+            f = open(os.path.join(directory, LANDMARKS), "rb")
+        except FileNotFoundError:
+            return None
+        with f:
+            if f.read(len(LANDMARKS_MAGIC)) != LANDMARKS_MAGIC:
+                return None
+            header_size = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(header_size))
+            if header["sources"] != source_stamps(directory):
+                return None
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        start = len(LANDMARKS_MAGIC) + 8 + header_size
+        size = header["num_people"]
+        view = memoryview(mapped)
+        distances = [
+            view[start + i * size:start + (i + 1) * size].cast("b")
+            for i in range(len(header["people"]))
+        ]
+        return cls(header["people"], distances, header["updates"])
+
+    def save(self, directory):
+        """
+        Write the landmark tables to `directory`, stamped like a graph snapshot.
+        """
+        header = json.dumps({
+            "sources": source_stamps(directory),
+            "people": self.people,
+            "updates": self.updates,
+            "num_people": len(self.distances[0]) if self.distances else 0
+        }).encode()
+        path = os.path.join(directory, LANDMARKS)
+        with open(path + ".tmp", "wb") as f:
+            f.write(LANDMARKS_MAGIC)
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header)
+            for table in self.distances:
+                f.write(table.tobytes())
+        os.replace(path + ".tmp", path)
+
+    def bounds(self, source, target):
+        """
+        Returns (lower, upper) bounds on the degrees of separation between
+        two person indices. Both are math.inf if a landmark proves they are
+        not connected; upper is math.inf if no landmark reaches them.
+        """
+        if source == target:
+            return 0, 0
+        lower = 1
+        upper = math.inf
+        for table in self.distances:
+            to_source = table[source]
+            to_target = table[target]
+            if to_source == UNREACHABLE and to_target == UNREACHABLE:
+                continue
+            if to_source == UNREACHABLE or to_target == UNREACHABLE:
+                # Exactly one of them is in this landmark's component
+                return math.inf, math.inf
+            lower = max(lower, abs(to_source - to_target))
+            upper = min(upper, to_source + to_target)
+        return lower, upper
+
+    def shortest_path(self, graph, source, target):
+        """
+        Same as `Graph.shortest_path`, but answers at once, without
+        searching, when the landmarks prove the two are not connected.
+        """
+        if self.bounds(source, target)[0] == math.inf:
+            return None
+        return graph.shortest_path(source, target)
+
+
+def main():
+    if len(sys.argv) not in [2, 3]:
+        sys.exit("Usage: python landmarks.py directory [count]")
+    directory = sys.argv[1]
+    count = int(sys.argv[2]) if len(sys.argv) == 3 else 16
+
+    print("Loading data...")
+    graph = Graph.load(directory)
+    print("Data loaded.")
+
+    start = time.perf_counter()
+    landmarks = Landmarks.build(graph, count)
+    landmarks.save(directory)
+    print(f"Saved {len(landmarks.people)} landmarks in {time.perf_counter() - start:.2f}s:")
+    for person in landmarks.people:
+        print(f"  {graph.person_names[person]} ({graph.person_ids[person]})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+# Fuzzy matches must share at least this (Dice) fraction of their trigrams
+MIN_SIMILARITY = 0.4
+
+
+class NameIndex():
+    """
+    Prefix and approximate lookup over people's names.
+
+    Names are kept lowercased in sorted order, so every name starting with
+    a prefix is one contiguous run found by bisection (a flattened trie).
+    A trigram index maps each three-letter chunk to the names containing it,
+    so misspelled names are found by counting shared trigrams.
+    Matches are ranked by a weight, such as how many movies a person has.
+    """
+
+    def __init__(self, entries):
+        """
+        Build the index from (name, key, weight) triples.
+        """
+        entries = sorted((name.lower(), key, weight) for name, key, weight in entries)
+        self.names = [name for name, _, _ in entries]
+        self.keys = [key for _, key, _ in entries]
+        self.weights = array("l", (weight for _, _, weight in entries))
+
+        self.grams = {}
+        self.gram_counts = array("l")
+        for i, name in enumerate(self.names):
+            grams = set(trigrams(name))
+            self.gram_counts.append(len(grams))
+            for gram in grams:
+                self.grams.setdefault(gram, array("l")).append(i)
+
+        # Entries added after building, scanned linearly until rebuilt
+        self.recent = []
+
+    def add(self, name, key, weight):
+        """
+        Add an entry without rebuilding the index.
+        """
+        self.recent.append((name.lower(), key, weight))
+
+    def exact(self, name):
+        """
+        Returns the keys of every entry named `name`, heaviest first.
+        """
+        name = name.lower()
+        start = bisect_left(self.names, name)
+        end = start
+        while end < len(self.names) and self.names[end] == name:
+            end += 1
+        recent = [entry for entry in self.recent if entry[0] == name]
+        return self._ranked(range(start, end), end - start + len(recent), recent)
+
+    def complete(self, prefix, limit=10):
+        """
+        Returns up to `limit` keys whose names start with `prefix`, heaviest first.
+        """
+        prefix = prefix.lower()
+        start = bisect_left(self.names, prefix)
+        end = bisect_left(self.names, prefix + "\U0010ffff", lo=start)
+        recent = [entry for entry in self.recent if entry[0].startswith(prefix)]
+        return self._ranked(range(start, end), limit, recent)
+
+    def search(self, query, limit=10):
+        """
+        Returns up to `limit` (key, similarity) pairs for the names most like
+        `query`, best match first, breaking ties by weight.
+        """
+        grams = set(trigrams(query.lower()))
+        if not grams:
+            return []
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.grams.get(gram, ()))
+
+        matches = []
+        for i, count in shared.items():
+            similarity = 2 * count / (len(grams) + self.gram_counts[i])
+            if similarity >= MIN_SIMILARITY:
+                matches.append((similarity, self.weights[i], self.keys[i]))
+        for name, key, weight in self.recent:
+            name_grams = set(trigrams(name))
+            similarity = 2 * len(grams & name_grams) / (len(grams) + len(name_grams))
+            if similarity >= MIN_SIMILARITY:
+                matches.append((similarity, weight, key))
+        return [
+            (key, similarity)
+            for similarity, _, key in heapq.nlargest(limit, matches, key=lambda m: m[:2])
+        ]
+
+    def best(self, name):
+        """
+        Returns the key for the heaviest person named exactly `name`,
+        else for the closest fuzzy match, else None.
+        """
+        matches = self.exact(name)
+        if matches:
+            return matches[0]
+        matches = self.search(name, limit=1)
+        return matches[0][0] if matches else None
+
+    def _ranked(self, entries, limit, recent=()):
+        candidates = [(self.weights[i], self.keys[i]) for i in entries]
+        candidates.extend((weight, key) for _, key, weight in recent)
+        return [key for _, key in heapq.nlargest(limit, candidates, key=lambda c: c[0])]
+
+
+def trigrams(name):
+    """
+    Returns the three-letter chunks of `name`, padded so that the start
+    and end of each word count as well.
+    """
+    padded = f"  {name} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
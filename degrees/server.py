@@ -0,0 +1,472 @@
+import json
+import math
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from graph import Graph, path_from_tree, reverse_path
+from landmarks import Landmarks
+
+# Number of recent source -> target results to remember
+PATH_CACHE_SIZE = 10000
+
+# Number of full BFS trees to remember, and how many queries a source
+# needs before its tree is worth computing
+TREE_CACHE_SIZE = 32
+TREE_THRESHOLD = 3
+
+
+class LRUCache():
+    """
+    Mapping that forgets its least recently used entry once full.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        if key not in self.entries:
+            return default
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+class ReadWriteLock():
+    """
+    Lets any number of searches read the graph at once, while updates
+    wait for them to finish and then have it to themselves.
+    """
+
+    def __init__(self):
+        self.readers = 0
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def reading(self):
+        with self.condition:
+            self.readers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if self.readers == 0:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self.condition:
+            while self.readers > 0:
+                self.condition.wait()
+            yield
+
+
+class DegreesService():
+    """
+    Answers shortest path queries against one loaded graph, caching recent
+    results and the BFS trees of frequently asked-about people.
+    """
+
+    def __init__(self, graph, landmarks=None):
+        self.graph = graph
+        # Landmark distances are only trusted for the graph they were built on
+        if landmarks is not None and landmarks.updates != graph.updates:
+            landmarks = None
+        self.landmarks = landmarks
+        self.paths = LRUCache(PATH_CACHE_SIZE)
+        self.trees = LRUCache(TREE_CACHE_SIZE)
+        self.source_counts = Counter()
+        self.stats = Counter()
+        self.lock = threading.Lock()
+        self.graph_lock = ReadWriteLock()
+
+    def shortest_path(self, source, target):
+        """
+        Returns (path, how) for the shortest path between two person indices,
+        where `how` says whether it came from the path cache, a cached BFS
+        tree, or a fresh search.
+        """
+        with self.lock:
+            self.stats["queries"] += 1
+            key = (source, target)
+            if key in self.paths:
+                self.stats["path_hits"] += 1
+                return self.paths.get(key), "path cache"
+
+            # The graph is undirected, so a tree from either end will do
+            tree = self.trees.get(source)
+            if tree is not None:
+                path = path_from_tree(tree, target)
+            else:
+                tree = self.trees.get(target)
+                if tree is not None:
+                    path = reverse_path(path_from_tree(tree, source), target)
+            if tree is not None:
+                self.stats["tree_hits"] += 1
+                self.paths.put(key, path)
+                return path, "tree cache"
+
+            self.source_counts[source] += 1
+            build_tree = self.source_counts[source] >= TREE_THRESHOLD
+
+        # Search outside the lock so other clients are not held up
+        with self.graph_lock.reading():
+            landmarks = self.landmarks
+            if build_tree:
+                tree = self.graph.bfs(source)
+                path = path_from_tree(tree, target)
+            elif landmarks is not None:
+                path = landmarks.shortest_path(self.graph, source, target)
+            else:
+                path = self.graph.shortest_path(source, target)
+
+            # Cache before releasing the graph, or an update could slip in
+            # between and leave a result for the old graph in the cache
+            with self.lock:
+                if build_tree:
+                    self.trees.put(source, tree)
+                    del self.source_counts[source]
+                self.paths.put(key, path)
+        return path, "search"
+
+    def update(self, rows):
+        """
+        Add people, movies and star rows to the graph (and its journal).
+        Drops only the cached results that the new star rows could change.
+        Returns counts of what was added and invalidated.
+        """
+        counts = Counter()
+        with self.graph_lock.writing(), self.lock:
+            # Check every row first, so a bad batch changes nothing
+            self.validate(rows)
+            try:
+                for person in rows.get("people", []):
+                    self.graph.add_person(person["id"], person["name"], person["birth"])
+                    counts["people"] += 1
+                for movie in rows.get("movies", []):
+                    self.graph.add_movie(movie["id"], movie["title"], movie["year"])
+                    counts["movies"] += 1
+                for star in rows.get("stars", []):
+                    # Co-stars must be read before the new row joins them
+                    person = self.graph.person_for_id(star["person_id"])
+                    movie = self.graph.movie_for_id(star["movie_id"])
+                    costars = [] if movie is None else list(self.graph.stars_for_movie(movie))
+                    leaves, anchors = self.pendant(person, movie, costars)
+                    if self.graph.add_star(star["person_id"], star["movie_id"]) is None:
+                        continue
+                    counts["stars"] += 1
+                    counts["invalidated"] += self.invalidate(person, movie, costars, leaves, anchors)
+            finally:
+                if counts["people"] or counts["stars"]:
+                    # New people are missing from the distance tables, and new
+                    # links can break their lower bounds
+                    self.landmarks = None
+        return dict(counts)
+
+    def validate(self, rows):
+        """
+        Raises ValueError unless `rows` is an object whose people, movies and
+        stars are lists of objects with string fields, and every star row
+        names a person and a movie that exist or are added by the same rows.
+        """
+        if not isinstance(rows, dict):
+            raise ValueError("Expected a JSON object with people, movies and stars")
+        sections = {
+            "people": ["id", "name", "birth"],
+            "movies": ["id", "title", "year"],
+            "stars": ["person_id", "movie_id"]
+        }
+        for section, fields in sections.items():
+            section_rows = rows.get(section, [])
+            if not isinstance(section_rows, list):
+                raise ValueError(f"Expected {section} to be a list")
+            for row in section_rows:
+                if not isinstance(row, dict):
+                    raise ValueError(f"Expected each of {section} to be an object")
+                for field in fields:
+                    if not isinstance(row.get(field), str):
+                        raise ValueError(f"Expected {section} rows to have a string {field}")
+
+        new_people = {person["id"] for person in rows.get("people", [])}
+        new_movies = {movie["id"] for movie in rows.get("movies", [])}
+        for star in rows.get("stars", []):
+            if star["person_id"] not in new_people and self.graph.person_for_id(star["person_id"]) is None:
+                raise ValueError(f"No person with id {star['person_id']}")
+            if star["movie_id"] not in new_movies and self.graph.movie_for_id(star["movie_id"]) is None:
+                raise ValueError(f"No movie with id {star['movie_id']}")
+
+    def pendant(self, person, movie, costars):
+        """
+        Returns (leaves, anchors) if a new star row only hangs people off
+        the rest of the graph: either the person has no movies yet, or each
+        co-star has no movie but this one. Returns (None, None) otherwise.
+        """
+        if person is None or movie is None:
+            return None, None
+        if len(self.graph.movies_for_person(person)) == 0:
+            return [person], costars
+        if all(list(self.graph.movies_for_person(costar)) == [movie] for costar in costars):
+            return costars, [person]
+        return None, None
+
+    def invalidate(self, person, movie, costars, leaves, anchors):
+        """
+        Drops cached trees and paths that could change now that `person`
+        is linked to each of `costars` through `movie`, and extends the trees
+        that only gain new leaves. Returns how many entries were dropped.
+        """
+        if not costars:
+            return 0
+
+        stale_trees = set()
+        for source, (distances, parents, via) in self.trees.entries.items():
+            def distance(p):
+                return distances[p] if p < len(distances) else -1
+
+            if leaves is not None:
+                # Leaves were only reachable if the tree grew from among them
+                if any(distance(leaf) != -1 for leaf in leaves):
+                    stale_trees.add(source)
+                    continue
+                reached = [anchor for anchor in anchors if distance(anchor) != -1]
+                if not reached:
+                    continue
+                anchor = min(reached, key=distance)
+                for tree_array in (distances, parents, via):
+                    tree_array.extend([-1] * (self.graph.num_people - len(tree_array)))
+                for leaf in leaves:
+                    distances[leaf] = distances[anchor] + 1
+                    parents[leaf] = anchor
+                    via[leaf] = movie
+                continue
+
+            # Otherwise a tree's distances only change if a new link joins
+            # two people more than one degree apart, or reaches a new part
+            # of the graph
+            for costar in costars:
+                a, b = distance(person), distance(costar)
+                if (a == -1) != (b == -1) or abs(a - b) > 1:
+                    stale_trees.add(source)
+                    break
+        for source in stale_trees:
+            del self.trees.entries[source]
+
+        stale_paths = []
+        for (source, target), path in self.paths.entries.items():
+            if source in stale_trees or target in stale_trees:
+                stale_paths.append((source, target))
+            elif leaves is not None:
+                # New leaves cannot shorten anyone else's path
+                if source in leaves or target in leaves:
+                    stale_paths.append((source, target))
+            elif source in self.trees or target in self.trees:
+                # A path is still shortest if a tree from either end still holds
+                continue
+            elif path is None or len(path) > 1:
+                # Without one, only a direct link is known to be safe
+                stale_paths.append((source, target))
+        for key in stale_paths:
+            del self.paths.entries[key]
+        return len(stale_trees) + len(stale_paths)
+
+    def resolve(self, params, field):
+        """
+        Returns the person index named by `field` (a name) or `field_id`
+        (an IMDB id) in the query parameters.
+        Raises ValueError if there is no such person.
+        """
+        if f"{field}_id" in params:
+            person = self.graph.person_for_id(params[f"{field}_id"])
+            if person is None:
+                raise ValueError(f"No person with id {params[field + '_id']}")
+            return person
+
+        name = params.get(field)
+        if name is None:
+            raise ValueError(f"Missing {field} or {field}_id")
+        # Ambiguous names go to the person with the most movies,
+        # and misspelled ones to the closest match
+        person = self.graph.name_index().best(name)
+        if person is None:
+            raise ValueError(f"Person not found: {name}")
+        return person
+
+    def names(self, query, fuzzy, limit):
+        """
+        Returns ranked candidates for a partial or misspelled name.
+        """
+        index = self.graph.name_index()
+        if fuzzy:
+            matches = index.search(query, limit)
+        else:
+            matches = [(person, None) for person in index.complete(query, limit)]
+        return [
+            {
+                "name": self.graph.person_names[person],
+                "id": self.graph.person_ids[person],
+                "birth": self.graph.person_births[person],
+                "movies": len(self.graph.movies_for_person(person)),
+                "similarity": similarity
+            }
+            for person, similarity in matches
+        ]
+
+    def describe(self, source, path):
+        """
+        Returns a path of indices as a list of printable steps.
+        """
+        steps = []
+        previous = source
+        for movie, person in path:
+            steps.append({
+                "person1": self.graph.person_names[previous],
+                "person2": self.graph.person_names[person],
+                "person2_id": self.graph.person_ids[person],
+                "movie": self.graph.movie_titles[movie],
+                "movie_id": self.graph.movie_ids[movie]
+            })
+            previous = person
+        return steps
+
+
+class Handler(BaseHTTPRequestHandler):
+    service = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path == "/path":
+            self.answer_path(params)
+        elif url.path == "/estimate":
+            self.answer_estimate(params)
+        elif url.path == "/names":
+            self.answer_names(params)
+        elif url.path == "/stats":
+            with self.service.lock:
+                stats = dict(self.service.stats)
+                stats["cached_paths"] = len(self.service.paths)
+                stats["cached_trees"] = len(self.service.trees)
+            self.reply(200, stats)
+        else:
+            self.reply(404, {"error": "Unknown endpoint, try /path, /estimate, /names or /stats"})
+
+    def answer_names(self, params):
+        try:
+            limit = int(params.get("limit", 10))
+        except ValueError:
+            self.reply(400, {"error": f"Invalid limit: {params['limit']}"})
+            return
+        fuzzy = params.get("fuzzy", "0") not in ["", "0"]
+        with self.service.graph_lock.reading():
+            names = self.service.names(params.get("q", ""), fuzzy, limit)
+        self.reply(200, names)
+
+    def answer_path(self, params):
+        start = time.perf_counter()
+        try:
+            with self.service.graph_lock.reading():
+                source = self.service.resolve(params, "source")
+                target = self.service.resolve(params, "target")
+        except ValueError as e:
+            self.reply(400, {"error": str(e)})
+            return
+        path, how = self.service.shortest_path(source, target)
+        latency = (time.perf_counter() - start) * 1000
+
+        if path is None:
+            body = {"connected": False}
+        else:
+            body = {
+                "connected": True,
+                "degrees": len(path),
+                "path": self.service.describe(source, path)
+            }
+        body["answered_from"] = how
+        body["latency_ms"] = round(latency, 3)
+        self.log_message("%s -> %s: %s in %.3f ms", source, target, how, latency)
+        self.reply(200, body)
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/update":
+            self.reply(404, {"error": "Unknown endpoint, try /update"})
+            return
+        start = time.perf_counter()
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            counts = self.service.update(json.loads(self.rfile.read(length)))
+        except (ValueError, KeyError) as e:
+            self.reply(400, {"error": str(e)})
+            return
+        counts["latency_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        self.reply(200, counts)
+
+    def answer_estimate(self, params):
+        start = time.perf_counter()
+        try:
+            # Read once, since an update can drop the landmarks at any time
+            with self.service.graph_lock.reading():
+                landmarks = self.service.landmarks
+                if landmarks is not None:
+                    source = self.service.resolve(params, "source")
+                    target = self.service.resolve(params, "target")
+        except ValueError as e:
+            self.reply(400, {"error": str(e)})
+            return
+        if landmarks is None:
+            self.reply(404, {"error": "No landmarks, run landmarks.py first"})
+            return
+        lower, upper = landmarks.bounds(source, target)
+        latency = (time.perf_counter() - start) * 1000
+        self.reply(200, {
+            "connected": lower != math.inf,
+            "lower": None if lower == math.inf else lower,
+            "upper": None if upper == math.inf else upper,
+            "latency_ms": round(latency, 3)
+        })
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main():
+    if len(sys.argv) > 3:
+        sys.exit("Usage: python server.py [directory] [port]")
+    directory = sys.argv[1] if len(sys.argv) > 1 else "large"
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+
+    print("Loading data...")
+    Handler.service = DegreesService(Graph.load(directory), Landmarks.load(directory))
+    print("Data loaded.")
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(f"Serving on http://127.0.0.1:{port}/path?source=...&target=...")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,12 @@
 import csv
+import heapq
 import itertools
+import multiprocessing
+import os
 import sys
 
+import numpy as np
+
 PROBS = {
 
     # Unconditional probabilities for having gene
@@ -36,33 +41,112 @@ PROBS = {
     "mutation": 0.01
 }
 
+# Possible numbers of copies of the gene, and values of the trait
+GENES = (0, 1, 2)
+TRAITS = (True, False)
+
+# Tables derived from PROBS once, indexed by gene count (and trait, as
+# False = 0 and True = 1), so evaluating a joint probability is a few
+# lookups per person instead of a chain of tests
+GENE_PRIOR = [PROBS["gene"][g] for g in GENES]
+TRAIT_LIKELIHOOD = [[PROBS["trait"][g][False], PROBS["trait"][g][True]] for g in GENES]
+
+# Probability that a parent with 0, 1 or 2 copies passes the gene on
+PASSES = [PROBS["mutation"], 0.5, 1 - PROBS["mutation"]]
+
+# INHERITANCE[mother][father][child] is the probability of the child's
+# gene count given their parents'
+INHERITANCE = [
+    [
+        [(1 - m) * (1 - f), m * (1 - f) + (1 - m) * f, m * f]
+        for f in PASSES
+    ]
+    for m in PASSES
+]
+
+# Assignments enumerated at once by `batch_probabilities`
+ENUMERATION_BATCH = 1 << 16
+
 
 def main():
 
     # Check for proper usage
-    if len(sys.argv) != 2:
-        sys.exit("Usage: python heredity.py data.csv")
+    if len(sys.argv) not in [2, 3] or (len(sys.argv) == 3 and sys.argv[2] not in METHODS):
+        sys.exit(f"Usage: python heredity.py data.csv [{'|'.join(METHODS)}]")
     people = load_data(sys.argv[1])
+    method = sys.argv[2] if len(sys.argv) == 3 else "enumerate"
+    probabilities = METHODS[method](people)
+
+    # Print results
+    for person in people:
+        print(f"{person}:")
+        for field in probabilities[person]:
+            print(f"  {field.capitalize()}:")
+            for value in probabilities[person][field]:
+                p = probabilities[person][field][value]
+                print(f"    {value}: {p:.4f}")
 
-    # Keep track of gene and trait probabilities for each person
-    probabilities = {
-        person: {
-            "gene": {
-                2: 0,
-                1: 0,
-                0: 0
-            },
-            "trait": {
-                True: 0,
-                False: 0
-            }
-        }
-        for person in people
-    }
+
+def enumerate_probabilities(people):
+    """
+    Compute every person's gene and trait distributions by enumerating
+    every possible assignment of genes and traits.
+    """
+    probabilities = enumerate_part((people, enumeration_slices(people)))
+
+    # Ensure probabilities sum to 1
+    normalize(probabilities)
+    return probabilities
+
+
+def parallel_probabilities(people, workers=None):
+    """
+    Compute the same distributions as `enumerate_probabilities`, with the
+    (have_trait, one_gene) slices of the enumeration dealt out across a
+    pool of `workers` processes. Each part returns unnormalized sums,
+    which are added up before normalizing.
+    """
+    workers = workers or os.cpu_count()
+
+    # A few parts per worker, so one slow part does not hold up the pool.
+    # A slice loops over every two_genes among the people not in one_gene,
+    # so costs about 2^(n - len(one_gene)) loops, plus a couple of loops'
+    # worth of setup. Giving the costliest slice left to the part with the
+    # least work so far keeps the parts even.
+    parts = [[] for _ in range(workers * 4)]
+    loads = [(0, part) for part in range(len(parts))]
+    slices = sorted(enumeration_slices(people), key=lambda s: len(s[1]))
+    for have_trait, one_gene in slices:
+        load, part = heapq.heappop(loads)
+        parts[part].append((have_trait, one_gene))
+        heapq.heappush(loads, (load + 2 ** (len(people) - len(one_gene)) + 2, part))
+
+    with multiprocessing.Pool(workers) as pool:
+        partials = pool.map(enumerate_part, [(people, part) for part in parts if part])
+
+    probabilities = partials[0]
+    for partial in partials[1:]:
+        for person in partial:
+            for field in partial[person]:
+                for value, p in partial[person][field].items():
+                    probabilities[person][field][value] += p
+
+    # Ensure probabilities sum to 1
+    normalize(probabilities)
+    return probabilities
+
+
+def enumeration_slices(people):
+    """
+    Yield a (have_trait, one_gene) slice of the enumeration for every set of
+    people who might have the trait, consistent with what is known, and
+    every set of people who might have one copy of the gene.
+    """
 
     # Loop over all sets of people who might have the trait
     names = set(people)
-    for have_trait in powerset(names):
+    subsets = powerset(names)
+    for have_trait in subsets:
 
         # Check if current set of people violates known information
         fails_evidence = any(
@@ -74,24 +158,49 @@ def main():
             continue
 
         # Loop over all sets of people who might have the gene
-        for one_gene in powerset(names):
-            for two_genes in powerset(names - one_gene):
+        for one_gene in subsets:
+            yield have_trait, one_gene
 
-                # Update probabilities with new joint probability
-                p = joint_probability(people, one_gene, two_genes, have_trait)
-                update(probabilities, one_gene, two_genes, have_trait, p)
 
-    # Ensure probabilities sum to 1
-    normalize(probabilities)
+def enumerate_part(task):
+    """
+    Return unnormalized gene and trait sums over part of the enumeration,
+    given a (people, slices) task, where each slice is a (have_trait,
+    one_gene) pair covering every two_genes under it.
+    """
+    people, slices = task
 
-    # Print results
-    for person in people:
-        print(f"{person}:")
-        for field in probabilities[person]:
-            print(f"  {field.capitalize()}:")
-            for value in probabilities[person][field]:
-                p = probabilities[person][field][value]
-                print(f"    {value}: {p:.4f}")
+    # Keep track of gene and trait probabilities for each person
+    probabilities = {
+        person: {
+            "gene": {
+                2: 0,
+                1: 0,
+                0: 0
+            },
+            "trait": {
+                True: 0,
+                False: 0
+            }
+        }
+        for person in people
+    }
+
+    names = set(people)
+    order = list(people)
+    parents = parent_indices(people)
+    for have_trait, one_gene in slices:
+        traits = [person in have_trait for person in order]
+        for two_genes in powerset(names - one_gene):
+
+            # Update probabilities with new joint probability
+            genes = [
+                1 if person in one_gene else 2 if person in two_genes else 0
+                for person in order
+            ]
+            p = assignment_probability(parents, genes, traits)
+            update(probabilities, one_gene, two_genes, have_trait, p)
+    return probabilities
 
 
 def load_data(filename):
@@ -138,89 +247,43 @@ def joint_probability(people, one_gene, two_genes, have_trait):
             * everyone in set `have_trait` has the trait, and
             * everyone not in set` have_trait` does not have the trait.
     """
-    final_probability = 1
-    zero_genes = people.keys() - (one_gene | two_genes)  # creating a set for no harmful genes
-
-    for person in zero_genes:
-        # if no parents found
-        if people[person]["mother"] == None and people[person]["father"] == None:
-            # unconditional probability for no harmful genes
-            probability = PROBS["gene"][0]
-        # if parents found
-        elif people[person]["mother"] != None:
-            probability = 1
-            mother = people[person]["mother"]
-            father = people[person]["father"]
-
-            if mother in zero_genes and father in zero_genes:
-                probability *= pow(1 - PROBS["mutation"], 2)
-            if mother in one_gene and father in one_gene:
-                probability *= pow(0.5, 2) 
-            if mother in two_genes and father in two_genes:
-                probability *= pow(PROBS["mutation"], 2)
-            
-            if (mother in zero_genes and father in one_gene) or (mother in one_gene and father in zero_genes):
-                probability *= (1 - PROBS["mutation"]) * 0.5
-            if (mother in zero_genes and father in two_genes) or (mother in two_genes and father in zero_genes):
-                probability *= (1 - PROBS["mutation"]) * PROBS["mutation"]
-            if (mother in one_gene and father in two_genes) or (mother in two_genes and father in one_gene):
-                probability *= 0.5 * PROBS["mutation"]
-        
-        # P(trait | 0 genes)
-        probability *= PROBS["trait"][0][person in have_trait]
-        final_probability *= probability
-
-    for person in one_gene:
-        if people[person]["mother"] == None and people[person]["father"] == None:
-            probability = PROBS["gene"][1]
-        elif people[person]["mother"] != None:
-            probability = 1
-            mother = people[person]["mother"]
-            father = people[person]["father"]
-
-            if mother in zero_genes and father in zero_genes:
-                probability *= PROBS["mutation"] * (1 - PROBS["mutation"]) + (1 - PROBS["mutation"]) * PROBS["mutation"]
-            if mother in one_gene and father in one_gene:
-                probability *= 2 * pow(0.5, 2)
-            if mother in two_genes and father in two_genes:
-                probability *= (1 - PROBS["mutation"]) * PROBS["mutation"] + PROBS["mutation"] * (1 - PROBS["mutation"])
-
-            if (mother in zero_genes and father in one_gene) or (mother in one_gene and father in zero_genes):
-                probability *= PROBS["mutation"] * 0.5 + (1 - PROBS["mutation"]) * 0.5
-            if (mother in one_gene and father in two_genes) or (mother in two_genes and father in one_gene):
-                probability *= 0.5 * PROBS["mutation"] + 0.5 * (1 - PROBS["mutation"])    
-            if (mother in zero_genes and father in two_genes) or (mother in two_genes and father in zero_genes):
-                probability *= pow(PROBS["mutation"], 2) + pow(1 - PROBS["mutation"], 2)
-
-        probability *= PROBS["trait"][1][person in have_trait]
-        final_probability *= probability
-
-    for person in two_genes:
-        if people[person]["mother"] == None and people[person]["father"] == None:
-            probability = PROBS["gene"][2]
-        elif people[person]["mother"] != None:
-            probability = 1
-            mother = people[person]["mother"]
-            father = people[person]["father"]
-            
-            if mother in zero_genes and father in zero_genes:
-                probability *= pow(PROBS["mutation"], 2)
-            if mother in one_gene and father in one_gene:
-                probability *= pow(0.5, 2)
-            if mother in two_genes and father in two_genes:
-                probability *= pow(1 - PROBS["mutation"], 2)
-
-            if (mother in zero_genes and father in one_gene) or (mother in one_gene and father in zero_genes):
-                probability *= PROBS["mutation"] * 0.5
-            if (mother in one_gene and father in two_genes) or (mother in two_genes and father in one_gene):
-                probability *= 0.5 * (1 - PROBS["mutation"])
-            if (mother in zero_genes and father in two_genes) or (mother in two_genes and father in zero_genes):
-                probability *= PROBS["mutation"] * (1 - PROBS["mutation"])
-
-        probability *= PROBS["trait"][2][person in have_trait]
-        final_probability *= probability
-
-    return final_probability
+    names = list(people)
+    genes = [
+        1 if person in one_gene else 2 if person in two_genes else 0
+        for person in names
+    ]
+    traits = [person in have_trait for person in names]
+    return assignment_probability(parent_indices(people), genes, traits)
+
+
+def parent_indices(people):
+    """
+    Return, for each person in the order of `people`, None if their parents
+    are unknown, else the (mother, father) positions in that same order.
+    """
+    position = {person: i for i, person in enumerate(people)}
+    return [
+        None if people[person]["mother"] is None else
+        (position[people[person]["mother"]], position[people[person]["father"]])
+        for person in people
+    ]
+
+
+def assignment_probability(parents, genes, traits):
+    """
+    Return the joint probability of a list of gene counts and a list of
+    traits, one per person, where `parents` comes from `parent_indices`.
+    A trait of None is left out, summing over both of its values.
+    """
+    probability = 1
+    for gene, parent, trait in zip(genes, parents, traits):
+        if parent is None:
+            probability *= GENE_PRIOR[gene]
+        else:
+            probability *= INHERITANCE[genes[parent[0]]][genes[parent[1]]][gene]
+        if trait is not None:
+            probability *= TRAIT_LIKELIHOOD[gene][trait]
+    return probability
 
 
 def update(probabilities, one_gene, two_genes, have_trait, p):
@@ -234,7 +297,7 @@ def update(probabilities, one_gene, two_genes, have_trait, p):
         # update gene distribution
         if person in one_gene:
             probabilities[person]["gene"][1] += p
-        if person in two_genes:
+        elif person in two_genes:
             probabilities[person]["gene"][2] += p
         else:
             probabilities[person]["gene"][0] += p
@@ -260,5 +323,277 @@ def normalize(probabilities):
             probabilities[person]["trait"][item] /= trait_prob
 
 
+def pedigree_factors(people):
+    """
+    Return the pedigree as a list of (variables, table) factors.
+    Variables are ("gene", person), and each table maps a tuple of gene
+    counts for the variables to a probability.
+    Known traits are evidence, so they appear as likelihoods over the
+    person's gene. Unknown traits are left out, since P(trait | gene)
+    sums to 1 over the trait and so does not change any gene's marginal.
+    """
+    factors = []
+    for person in people:
+        mother = people[person]["mother"]
+        father = people[person]["father"]
+        gene = ("gene", person)
+
+        # P(gene | parents' genes), or the unconditional P(gene)
+        if mother is None and father is None:
+            factors.append(((gene,), {(g,): GENE_PRIOR[g] for g in GENES}))
+        else:
+            factors.append((
+                (("gene", mother), ("gene", father), gene),
+                {
+                    (m, f, g): INHERITANCE[m][f][g]
+                    for m in GENES for f in GENES for g in GENES
+                }
+            ))
+
+        # P(observed trait | gene)
+        trait = people[person]["trait"]
+        if trait is not None:
+            factors.append(((gene,), {(g,): TRAIT_LIKELIHOOD[g][trait] for g in GENES}))
+    return factors
+
+
+def multiply(factors):
+    """
+    Return the product of a list of factors.
+    """
+    variables = []
+    for factor_variables, _ in factors:
+        for variable in factor_variables:
+            if variable not in variables:
+                variables.append(variable)
+
+    # Where each factor's variables sit in the product's
+    positions = [
+        ([variables.index(variable) for variable in factor_variables], factor_table)
+        for factor_variables, factor_table in factors
+    ]
+    table = {}
+    for values in itertools.product(GENES, repeat=len(variables)):
+        p = 1
+        for indices, factor_table in positions:
+            p *= factor_table[tuple([values[i] for i in indices])]
+        table[values] = p
+    return tuple(variables), table
+
+
+def sum_out(factor, variable):
+    """
+    Return `factor` with `variable` summed out.
+    """
+    variables, table = factor
+    i = variables.index(variable)
+    summed = {}
+    for values, p in table.items():
+        rest = values[:i] + values[i + 1:]
+        summed[rest] = summed.get(rest, 0) + p
+    return variables[:i] + variables[i + 1:], summed
+
+
+def elimination_order(factors):
+    """
+    Return an order in which to eliminate every variable in `factors`,
+    greedily picking the variable whose elimination adds the fewest new
+    edges between its neighbors (min-fill), so intermediate factors stay
+    small on tree-like pedigrees.
+    """
+    neighbors = {}
+    for variables, _ in factors:
+        for variable in variables:
+            neighbors.setdefault(variable, set()).update(variables)
+    for variable in neighbors:
+        neighbors[variable].discard(variable)
+
+    def score(variable):
+        around = list(neighbors[variable])
+        fill = sum(
+            1 for a, b in itertools.combinations(around, 2)
+            if b not in neighbors[a]
+        )
+        return fill, len(around), variable
+
+    scores = {variable: score(variable) for variable in neighbors}
+    order = []
+    while scores:
+        variable = min(scores, key=scores.get)
+        order.append(variable)
+        del scores[variable]
+
+        # Connect its neighbors, as the factor it leaves behind will
+        around = neighbors.pop(variable)
+        for other in around:
+            neighbors[other] |= around - {other}
+            neighbors[other].discard(variable)
+
+        # Only scores within two steps of the new edges can have changed
+        changed = set(around)
+        for other in around:
+            changed |= neighbors[other]
+        for other in changed:
+            scores[other] = score(other)
+    return order
+
+
+def marginal(factors, order, variable):
+    """
+    Return the normalized distribution of `variable` given the evidence
+    in `factors`, by eliminating every other variable in `order`.
+    Each factor waits in the bucket of its first variable to be
+    eliminated, so each step only touches the factors it sums over.
+    """
+    position = {other: i for i, other in enumerate(order) if other != variable}
+    buckets = {other: [] for other in position}
+    remaining = []
+
+    def place(factor):
+        variables = [other for other in factor[0] if other != variable]
+        if variables:
+            buckets[min(variables, key=position.get)].append(factor)
+        else:
+            remaining.append(factor)
+
+    for factor in factors:
+        place(factor)
+    for eliminated in position:
+        if buckets[eliminated]:
+            place(sum_out(multiply(buckets.pop(eliminated)), eliminated))
+
+    variables, table = multiply(remaining)
+    total = sum(table.values())
+    return {values[variables.index(variable)]: p / total for values, p in table.items()}
+
+
+def eliminate_probabilities(people):
+    """
+    Compute the same gene and trait distributions as enumeration, by
+    treating the pedigree as a Bayesian network and running variable
+    elimination once for each person's gene. Each run costs time
+    exponential only in the pedigree's treewidth, which stays small for
+    family trees, instead of in the number of people.
+    """
+    factors = pedigree_factors(people)
+    order = elimination_order(factors)
+    genes = {person: marginal(factors, order, ("gene", person)) for person in people}
+    return with_traits(people, genes)
+
+
+def batch_probabilities(people):
+    """
+    Compute every person's gene and trait distributions by enumerating
+    every assignment of genes and unknown traits, like
+    `enumerate_probabilities`, but a batch of assignments at a time as the
+    rows of NumPy arrays. Table lookups, products and marginal sums then
+    run as vectorized operations instead of one Python call per assignment.
+    """
+    order = list(people)
+    parents = parent_indices(people)
+    unknown = [i for i, person in enumerate(order) if people[person]["trait"] is None]
+    observed = np.array([bool(people[person]["trait"]) for person in order], dtype=np.intp)
+
+    prior = np.array(GENE_PRIOR)
+    inheritance = np.array(INHERITANCE)
+    likelihood = np.array(TRAIT_LIKELIHOOD)
+
+    # Each assignment is a number whose low base-3 digits are everyone's
+    # gene counts and whose high base-2 digits are the unknown traits
+    gene_places = 3 ** np.arange(len(order), dtype=np.int64)
+    trait_places = 3 ** len(order) * 2 ** np.arange(len(unknown), dtype=np.int64)
+    total = 3 ** len(order) * 2 ** len(unknown)
+
+    genes_total = np.zeros((len(order), 3))
+    traits_total = np.zeros((len(order), 2))
+    for start in range(0, total, ENUMERATION_BATCH):
+        assignments = np.arange(start, min(start + ENUMERATION_BATCH, total), dtype=np.int64)
+        genes = (assignments[:, None] // gene_places % 3).astype(np.intp)
+        traits = np.tile(observed, (len(assignments), 1))
+        traits[:, unknown] = assignments[:, None] // trait_places % 2
+
+        p = np.ones(len(assignments))
+        for i, parent in enumerate(parents):
+            if parent is None:
+                p *= prior[genes[:, i]]
+            else:
+                p *= inheritance[genes[:, parent[0]], genes[:, parent[1]], genes[:, i]]
+            p *= likelihood[genes[:, i], traits[:, i]]
+
+        for i in range(len(order)):
+            genes_total[i] += np.bincount(genes[:, i], weights=p, minlength=3)
+            traits_total[i] += np.bincount(traits[:, i], weights=p, minlength=2)
+
+    probabilities = {
+        person: {
+            "gene": {g: float(genes_total[i, g]) for g in (2, 1, 0)},
+            "trait": {t: float(traits_total[i, int(t)]) for t in TRAITS}
+        }
+        for i, person in enumerate(order)
+    }
+    normalize(probabilities)
+    return probabilities
+
+
+def enumerate_genes(people):
+    """
+    Compute the same gene and trait distributions as enumeration, but
+    enumerate only gene assignments. Known traits weigh each assignment
+    by their likelihood, and unknown traits are summed out analytically
+    afterwards, saving the 2^n loop over every set of people with the trait.
+    """
+    genes = {
+        person: {
+            2: 0,
+            1: 0,
+            0: 0
+        }
+        for person in people
+    }
+    order = list(people)
+    parents = parent_indices(people)
+    traits = [people[person]["trait"] for person in order]
+    for counts in itertools.product(GENES, repeat=len(order)):
+        p = assignment_probability(parents, counts, traits)
+        for person, count in zip(order, counts):
+            genes[person][count] += p
+    return with_traits(people, genes)
+
+
+def with_traits(people, genes):
+    """
+    Return the distributions for every person, given each person's
+    (possibly unnormalized) gene distribution conditioned on the evidence.
+    A trait depends only on its person's gene, so an unknown trait's
+    distribution is P(trait | gene) averaged over their gene posterior.
+    """
+    probabilities = {}
+    for person in people:
+        total = sum(genes[person].values())
+        gene = {g: genes[person][g] / total for g in (2, 1, 0)}
+        trait = people[person]["trait"]
+        if trait is None:
+            trait = {
+                t: sum(gene[g] * PROBS["trait"][g][t] for g in GENES)
+                for t in TRAITS
+            }
+        else:
+            trait = {True: float(trait), False: float(not trait)}
+        probabilities[person] = {
+            "gene": gene,
+            "trait": trait
+        }
+    return probabilities
+
+
+METHODS = {
+    "enumerate": enumerate_probabilities,
+    "parallel": parallel_probabilities,
+    "batch": batch_probabilities,
+    "genes": enumerate_genes,
+    "elimination": eliminate_probabilities
+}
+
+
 if __name__ == "__main__":
     main()
@@ -1,26 +1,53 @@
+import concurrent.futures
+import json
 import os
 import random
 import math
+import multiprocessing
+import queue
 import re
 import sys
 import copy
+import time
+
+import numpy as np
+from scipy import sparse, stats
+from scipy.sparse.linalg import spsolve_triangular
 
 DAMPING = 0.85
 SAMPLES = 10000
 
+# Links found in each page of a corpus, saved in the corpus directory
+LINK_CACHE = "links.cache"
+
+# Number of files to parse before it is worth starting a process pool
+PARALLEL_CRAWL = 256
+
+# How often `solve_pagerank` extrapolates when using method="quadratic"
+EXTRAPOLATION_PERIOD = 10
+
+# Edges handled per chunk by `out_of_core_pagerank`
+EDGE_CHUNK = 1 << 22
+
+# Random numbers drawn at a time by `random_walk`
+WALK_BATCH = 65536
+
+# Smallest batch of pages `adaptive_sample_pagerank` samples at a time
+ADAPTIVE_BATCH = 250
+
 
 def main():
     if len(sys.argv) != 2:
         sys.exit("Usage: python pagerank.py corpus")
     corpus = crawl(sys.argv[1])
-    ranks = sample_pagerank(corpus, DAMPING, SAMPLES)
+    ranks = walk_pagerank(corpus, DAMPING, SAMPLES)
     total_prob = 0
     print(f"PageRank Results from Sampling (n = {SAMPLES})")
     for page in sorted(ranks):
         print(f"  {page}: {ranks[page]:.4f}")
         total_prob += ranks[page]
     print("Sum of the probabilities: ", round(total_prob, 4))
-    ranks = iterate_pagerank(corpus, DAMPING)
+    ranks = matrix_pagerank(corpus, DAMPING)
     total_prob = 0
     print(f"PageRank Results from Iteration")
     for page in sorted(ranks):
@@ -29,22 +56,45 @@ def main():
     print("Sum of the probabilities: ", round(total_prob, 4))
 
 
-def crawl(directory):
+def crawl(directory, cache=True):
     """
     Parse a directory of HTML pages and check for links to other pages.
     Return a dictionary where each key is a page, and values are
     a list of all other pages in the corpus that are linked to by the page.
+
+    With `cache`, the links found in each file are kept in a cache file
+    in the directory, keyed by file name, size and mtime, so only new or
+    changed files are parsed again. Those are parsed in parallel when
+    there are enough of them to be worth it.
     """
     pages = dict()
 
-    # Extract all links from HTML files
-    for filename in os.listdir(directory):
-        if not filename.endswith(".html"):
+    # Find the HTML files, and the ones the cache can answer for
+    cached = read_link_cache(directory) if cache else {}
+    stamps = {}
+    for entry in os.scandir(directory):
+        if not entry.name.endswith(".html"):
             continue
-        with open(os.path.join(directory, filename)) as f:
-            contents = f.read()
-            links = re.findall(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"", contents)
-            pages[filename] = set(links) - {filename}
+        stat = entry.stat()
+        stamps[entry.name] = [stat.st_size, stat.st_mtime_ns]
+        if entry.name in cached and cached[entry.name][:2] == stamps[entry.name]:
+            pages[entry.name] = set(cached[entry.name][2])
+
+    # Extract all links from the rest of the HTML files
+    stale = [filename for filename in stamps if filename not in pages]
+    paths = [os.path.join(directory, filename) for filename in stale]
+    if len(stale) >= PARALLEL_CRAWL:
+        with concurrent.futures.ProcessPoolExecutor() as executor:
+            found = executor.map(extract_links, paths, chunksize=64)
+            pages.update(zip(stale, found))
+    else:
+        pages.update(zip(stale, map(extract_links, paths)))
+
+    if cache and (stale or len(cached) != len(stamps)):
+        write_link_cache(directory, {
+            filename: stamps[filename] + [sorted(pages[filename])]
+            for filename in stamps
+        })
 
     # Only include links to other pages in the corpus
     for filename in pages:
@@ -56,6 +106,42 @@ def crawl(directory):
     return pages
 
 
+def extract_links(path):
+    """
+    Return the set of pages linked to by the HTML file at `path`,
+    other than itself.
+    """
+    with open(path) as f:
+        contents = f.read()
+    links = re.findall(r"<a\s+(?:[^>]*?)href=\"([^\"]*)\"", contents)
+    return set(links) - {os.path.basename(path)}
+
+
+def read_link_cache(directory):
+    """
+    Return the link cache for `directory` as a dictionary of
+    filename: [size, mtime, links], or an empty one if there is none.
+    """
+    try:
+        with open(os.path.join(directory, LINK_CACHE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_link_cache(directory, entries):
+    """
+    Replace the link cache for `directory`, if it is writable.
+    """
+    path = os.path.join(directory, LINK_CACHE)
+    try:
+        with open(path + ".tmp", "w") as f:
+            json.dump(entries, f)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        pass
+
+
 def transition_model(corpus, page, damping_factor):
     """
     Return a probability distribution over which page to visit next,
@@ -106,6 +192,200 @@ def sample_pagerank(corpus, damping_factor, n):
     return sample_pr
 
 
+def outlink_arrays(corpus):
+    """
+    Return (pages, offsets, links) for a corpus, where `pages` lists the
+    pages in index order and the indices of the pages linked to by page i
+    are links[offsets[i]:offsets[i + 1]].
+    """
+    pages = sorted(corpus)
+    index = {page: i for i, page in enumerate(pages)}
+    offsets = np.zeros(len(pages) + 1, dtype=np.int64)
+    links = []
+    for i, page in enumerate(pages):
+        links.extend(index[link] for link in corpus[page])
+        offsets[i + 1] = len(links)
+    return pages, offsets, np.array(links, dtype=np.int64)
+
+
+def random_walk(offsets, links, damping_factor, n, seed=None, report=None):
+    """
+    Walk `n` pages, starting at a page at random, and return how many
+    times each page was visited as a NumPy array.
+
+    Each step is one coin flip: with probability `damping_factor` follow
+    a random link of the current page, otherwise (or if it has no links)
+    jump to a page chosen uniformly. That is the same transition model as
+    `transition_model`, drawn in O(1) instead of building a distribution.
+
+    If given, `report` is called with the number of pages walked so far
+    after each batch.
+    """
+    rng = np.random.default_rng(seed)
+    N = len(offsets) - 1
+    counts = np.zeros(N, dtype=np.int64)
+    # Plain lists index faster than NumPy arrays one item at a time
+    offsets = offsets.tolist()
+    links = links.tolist()
+
+    page = int(rng.integers(N))
+    visits = [page]
+    remaining = n - 1
+    while True:
+        counts += np.bincount(visits, minlength=N)
+        if report is not None:
+            report(n - remaining)
+        if remaining <= 0:
+            break
+        size = min(WALK_BATCH, remaining)
+        remaining -= size
+        follows = (rng.random(size) < damping_factor).tolist()
+        picks = rng.random(size).tolist()
+        jumps = rng.integers(N, size=size).tolist()
+
+        visits = []
+        for follow, pick, jump in zip(follows, picks, jumps):
+            start = offsets[page]
+            count = offsets[page + 1] - start
+            if follow and count:
+                page = links[start + int(pick * count)]
+            else:
+                page = jump
+            visits.append(page)
+    return counts
+
+
+def walk_pagerank(corpus, damping_factor, n, seed=None):
+    """
+    Return PageRank values estimated, like `sample_pagerank`, from `n`
+    pages sampled along a random walk, with each step drawn in O(1).
+    """
+    pages, offsets, links = outlink_arrays(corpus)
+    counts = random_walk(offsets, links, damping_factor, n, seed)
+    return dict(zip(pages, (counts / n).tolist()))
+
+
+def parallel_walk_pagerank(corpus, damping_factor, n, workers=None, seed=None):
+    """
+    Return PageRank values estimated from `n` pages sampled by independent
+    random walks run across a pool of `workers` processes.
+
+    Each walker gets its own stream spawned from `seed`, so a run can be
+    reproduced with the same seed and worker count. Progress is printed
+    per worker to stderr as batches finish.
+    """
+    workers = workers or os.cpu_count()
+    pages, offsets, links = outlink_arrays(corpus)
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    shares = [n // workers + (1 if i < n % workers else 0) for i in range(workers)]
+
+    progress = multiprocessing.Queue()
+    with multiprocessing.Pool(
+        workers, initializer=start_walker,
+        initargs=(offsets, links, damping_factor, progress)
+    ) as pool:
+        result = pool.map_async(walker, list(enumerate(zip(shares, seeds))))
+        finished = 0
+        while finished < workers:
+            try:
+                worker, done = progress.get(timeout=1)
+            except queue.Empty:
+                # A walker that failed never reports finishing
+                if result.ready():
+                    break
+                continue
+            print(f"Walker {worker}: {done}/{shares[worker]} pages", file=sys.stderr)
+            if done == shares[worker]:
+                finished += 1
+        counts = sum(result.get())
+
+    return dict(zip(pages, (counts / n).tolist()))
+
+
+# Set in each pool process by `start_walker`
+walker_state = None
+
+
+def start_walker(offsets, links, damping_factor, progress):
+    global walker_state
+    walker_state = (offsets, links, damping_factor, progress)
+
+
+def walker(task):
+    """
+    Run one worker's share of a parallel walk, reporting progress.
+    """
+    worker, (n, seed) = task
+    offsets, links, damping_factor, progress = walker_state
+    if n == 0:
+        progress.put((worker, 0))
+        return np.zeros(len(offsets) - 1, dtype=np.int64)
+    return random_walk(
+        offsets, links, damping_factor, n, seed,
+        report=lambda done: progress.put((worker, done))
+    )
+
+
+def adaptive_sample_pagerank(corpus, damping_factor, epsilon=0.01, top_k=None,
+                             confidence=0.95, batch=None, min_batches=8,
+                             patience=3, max_samples=10 ** 8, seed=None):
+    """
+    Sample PageRank in batches until the estimate is good enough, and
+    return (ranks, intervals, samples): the PageRank values, a
+    {page: (low, high)} confidence interval for each, and the number of
+    pages actually sampled.
+
+    Each batch is an independent random walk of `batch` pages, by default
+    ADAPTIVE_BATCH or one per page in the corpus, whichever is more. The
+    spread of the per-batch estimates gives each page's confidence interval
+    at the `confidence` level, using Student's t so that the first few
+    batches do not stop sampling too early. Sampling stops, after at least
+    `min_batches`, once every interval is within `epsilon` of its estimate.
+    If `top_k` is given, only the `top_k` highest ranked pages need to be
+    that precise, but they must also have stayed in the same order for
+    `patience` batches in a row.
+    It always stops by `max_samples`.
+    """
+    pages, offsets, links = outlink_arrays(corpus)
+    streams = np.random.SeedSequence(seed)
+    batch = batch or max(ADAPTIVE_BATCH, len(pages))
+
+    estimates = []
+    order = None
+    stable = 0
+    while True:
+        counts = random_walk(offsets, links, damping_factor, batch, streams.spawn(1)[0])
+        estimates.append(counts / batch)
+        samples = len(estimates) * batch
+
+        mean = np.mean(estimates, axis=0)
+        if len(estimates) > 1:
+            z = stats.t.ppf((1 + confidence) / 2, len(estimates) - 1)
+            half_width = z * np.std(estimates, axis=0, ddof=1) / math.sqrt(len(estimates))
+        else:
+            half_width = np.ones(len(pages))
+
+        if top_k is None:
+            done = np.all(half_width <= epsilon)
+        else:
+            top = np.argsort(-mean, kind="stable")[:top_k].tolist()
+            stable = stable + 1 if top == order else 0
+            order = top
+            done = stable >= patience and np.all(half_width[top] <= epsilon)
+
+        if len(estimates) >= min_batches and done:
+            break
+        if samples + batch > max_samples:
+            break
+
+    ranks = dict(zip(pages, mean.tolist()))
+    intervals = {
+        page: (max(0.0, low), high)
+        for page, low, high in zip(pages, (mean - half_width).tolist(), (mean + half_width).tolist())
+    }
+    return ranks, intervals, samples
+
+
 def iterate_pagerank(corpus, damping_factor):
     """
     Return PageRank values for each page by iteratively updating
@@ -149,5 +429,437 @@ def iterate_pagerank(corpus, damping_factor):
     return iterate_pr
 
 
+def link_matrix(corpus):
+    """
+    Return (pages, matrix, dangling) for a corpus, where `pages` lists the
+    pages in index order, `matrix` is the sparse column-stochastic link
+    matrix (entry [i, j] is the chance of following a link from page j to
+    page i) and `dangling` marks the pages with no links.
+    """
+    pages = sorted(corpus)
+    index = {page: i for i, page in enumerate(pages)}
+    rows = []
+    columns = []
+    weights = []
+    for page in pages:
+        links = corpus[page]
+        for link in links:
+            rows.append(index[link])
+            columns.append(index[page])
+            weights.append(1 / len(links))
+    N = len(pages)
+    matrix = sparse.csr_matrix((weights, (rows, columns)), shape=(N, N))
+    dangling = np.array([not corpus[page] for page in pages], dtype=bool)
+    return pages, matrix, dangling
+
+
+def matrix_pagerank(corpus, damping_factor):
+    """
+    Return the same PageRank values as `iterate_pagerank`, computed by
+    vectorized power iteration over a sparse link matrix built once.
+
+    Pages with no links spread their rank over every page, which adds the
+    same amount to every entry rather than filling in a dense column.
+    """
+    pages, matrix, dangling = link_matrix(corpus)
+    N = len(pages)
+    ranks, _ = power_iterate(matrix, dangling, damping_factor, np.full(N, 1 / N))
+    return dict(zip(pages, ranks.tolist()))
+
+
+def power_iterate(matrix, dangling, damping_factor, ranks, tolerance=0.001):
+    """
+    Run power iteration from the rank vector `ranks` until no rank moves
+    by more than `tolerance`. Return the new ranks and the iterations run.
+    """
+    iterations = 0
+    while True:
+        iterations += 1
+        new_ranks = power_step(matrix, dangling, damping_factor, ranks)
+        # Same stopping rule as iterate_pagerank: no rank moved more than `tolerance`
+        close_enough = np.all(np.abs(new_ranks - ranks) <= tolerance)
+        ranks = new_ranks
+        if close_enough:
+            return ranks, iterations
+
+
+def power_step(matrix, dangling, damping_factor, ranks):
+    """
+    Return the rank vector after one step of the PageRank random surfer.
+    """
+    N = len(ranks)
+    dangling_rank = ranks[dangling].sum() / N
+    return (1 - damping_factor) / N + damping_factor * (matrix @ ranks + dangling_rank)
+
+
+def solve_pagerank(corpus, damping_factor, tolerance=1e-8, max_iterations=1000,
+                   method="power", callback=None):
+    """
+    Return (ranks, history): PageRank values for each page, and one
+    {"iteration", "residual", "seconds"} entry per iteration, where the
+    residual is the L1 norm of the change in the rank vector.
+
+    Stops once the residual is below `tolerance`, or after `max_iterations`.
+    `method` is one of
+        * "power": plain power iteration, as in `matrix_pagerank`;
+        * "gauss-seidel": sweeps that use each page's new rank as soon as
+          it is known, by solving the lower-triangular part of the system;
+        * "quadratic": power iteration with quadratic extrapolation every
+          EXTRAPOLATION_PERIOD iterations, which cancels the slowest
+          decaying error terms.
+    If given, `callback` is called with each history entry as it happens.
+    """
+    pages, matrix, dangling = link_matrix(corpus)
+    N = len(pages)
+    ranks = np.full(N, 1 / N)
+
+    if method == "gauss-seidel":
+        # Solve (I - dM) x = b by splitting dM into its lower part, with the
+        # diagonal for pages that link to themselves, and strictly upper part
+        lower = (sparse.identity(N, format="csr") - damping_factor * sparse.tril(matrix, k=0)).tocsr()
+        upper = (damping_factor * sparse.triu(matrix, k=1)).tocsr()
+    elif method not in ["power", "quadratic"]:
+        raise ValueError(f"Unknown method: {method}")
+
+    history = []
+    previous = []
+    for iteration in range(1, max_iterations + 1):
+        start = time.perf_counter()
+        if method == "gauss-seidel":
+            # The teleport and dangling terms lag one sweep behind
+            constant = (1 - damping_factor) / N + damping_factor * ranks[dangling].sum() / N
+            new_ranks = spsolve_triangular(lower, upper @ ranks + constant, lower=True)
+            new_ranks /= new_ranks.sum()
+        else:
+            new_ranks = power_step(matrix, dangling, damping_factor, ranks)
+            if method == "quadratic":
+                previous = (previous + [ranks])[-3:]
+                if iteration % EXTRAPOLATION_PERIOD == 0 and len(previous) == 3:
+                    new_ranks = quadratic_extrapolation(*previous, new_ranks)
+
+        residual = float(np.abs(new_ranks - ranks).sum())
+        ranks = new_ranks
+        entry = {
+            "iteration": iteration,
+            "residual": residual,
+            "seconds": time.perf_counter() - start
+        }
+        history.append(entry)
+        if callback is not None:
+            callback(entry)
+        if residual < tolerance:
+            break
+
+    return dict(zip(pages, ranks.tolist())), history
+
+
+def quadratic_extrapolation(x3, x2, x1, x0):
+    """
+    Return an estimate of the PageRank vector from the last four power
+    iterates, oldest first (Kamvar et al., "Extrapolation Methods for
+    Accelerating PageRank Computations"). Assumes the iterates are mostly
+    a combination of the top three eigenvectors, and removes the second
+    and third.
+    """
+    y2 = x2 - x3
+    y1 = x1 - x3
+    y0 = x0 - x3
+    gamma, *_ = np.linalg.lstsq(np.column_stack([y2, y1]), -y0, rcond=None)
+    gamma1, gamma2 = gamma
+    gamma3 = 1
+    beta0 = gamma1 + gamma2 + gamma3
+    beta1 = gamma2 + gamma3
+    beta2 = gamma3
+    ranks = beta0 * x2 + beta1 * x1 + beta2 * x0
+    ranks = np.abs(ranks)
+    return ranks / ranks.sum()
+
+
+def teleport_matrix(corpus, seed_sets):
+    """
+    Return a teleport matrix for `personalized_pagerank`: one column per
+    set of seed pages, spreading the teleport chance evenly over the seeds.
+    Rows are in the same (sorted) page order as `link_matrix`.
+    """
+    pages = sorted(corpus)
+    index = {page: i for i, page in enumerate(pages)}
+    teleport = np.zeros((len(pages), len(seed_sets)))
+    for j, seeds in enumerate(seed_sets):
+        for page in seeds:
+            teleport[index[page], j] = 1 / len(seeds)
+    return teleport
+
+
+def personalized_pagerank(corpus, teleport, damping_factors=DAMPING,
+                          tolerance=1e-8, max_iterations=1000):
+    """
+    Return (pages, ranks) for many personalized PageRanks at once.
+
+    `teleport` is an N x k matrix whose columns are the distributions the
+    random surfer jumps to instead of a uniformly chosen page, in the page
+    order of `link_matrix` (see `teleport_matrix`). Pages with no links send
+    the surfer to the same distribution. All columns, for every damping
+    factor, are iterated together as one dense block, so each pass over the
+    sparse link matrix serves every personalization.
+
+    `ranks` is an N x k array, or, if `damping_factors` is a sequence of m
+    values, an m x N x k array with one N x k block per damping factor.
+    Iteration stops once every column's L1 change is below `tolerance`.
+    Raises ValueError if a column of `teleport` sums to zero.
+    """
+    pages, matrix, dangling = link_matrix(corpus)
+    teleport = np.asarray(teleport, dtype=float)
+    totals = teleport.sum(axis=0)
+    if np.any(totals <= 0):
+        empty = np.flatnonzero(totals <= 0).tolist()
+        raise ValueError(f"Teleport columns {empty} have no weight, as for an empty seed set")
+    teleport = teleport / totals
+    N, k = teleport.shape
+    dampings = np.atleast_1d(np.asarray(damping_factors, dtype=float))
+
+    # Column d * k + j is seed set j under damping factor d
+    block = np.tile(teleport, len(dampings))
+    damping = np.repeat(dampings, k)
+
+    ranks = block.copy()
+    for _ in range(max_iterations):
+        # Teleporting and leaving a dangling page both land on the seed set
+        jump = (1 - damping) + damping * ranks[dangling].sum(axis=0)
+        new_ranks = matrix @ ranks
+        new_ranks *= damping
+        new_ranks += block * jump
+        residual = np.abs(new_ranks - ranks).sum(axis=0)
+        ranks = new_ranks
+        if np.all(residual < tolerance):
+            break
+
+    ranks = ranks.reshape(N, len(dampings), k).transpose(1, 0, 2)
+    if np.ndim(damping_factors) == 0:
+        ranks = ranks[0]
+    return pages, ranks
+
+
+def write_edge_store(directory, store):
+    """
+    Crawl the HTML pages in `directory` straight into an on-disk edge list
+    in `store`, without ever holding the whole link graph in memory.
+
+    The store holds
+        * pages.txt: page names, one per line, in page id order;
+        * offsets.npy: the links of page i are links[offsets[i]:offsets[i + 1]],
+          so out-degrees are consecutive differences;
+        * links.bin: the linked page ids as raw int32, sorted by source page
+          and then by target.
+    """
+    pages = sorted(name for name in os.listdir(directory) if name.endswith(".html"))
+    index = {page: i for i, page in enumerate(pages)}
+    os.makedirs(store, exist_ok=True)
+
+    with open(os.path.join(store, "pages.txt"), "w") as f:
+        for page in pages:
+            f.write(page + "\n")
+
+    # Pages are visited in id order, so edges come out sorted by source
+    offsets = np.zeros(len(pages) + 1, dtype=np.int64)
+    with open(os.path.join(store, "links.bin"), "wb") as f:
+        for i, page in enumerate(pages):
+            links = extract_links(os.path.join(directory, page))
+            ids = np.array(sorted(index[link] for link in links if link in index), dtype=np.int32)
+            f.write(ids.tobytes())
+            offsets[i + 1] = offsets[i] + len(ids)
+    np.save(os.path.join(store, "offsets.npy"), offsets)
+
+
+def open_edge_store(store):
+    """
+    Return (offsets, links) from an edge store as memory-mapped arrays.
+    """
+    offsets = np.load(os.path.join(store, "offsets.npy"), mmap_mode="r")
+    path = os.path.join(store, "links.bin")
+
+    # An empty file cannot be mapped, as when no page links to another
+    if os.path.getsize(path) == 0:
+        return offsets, np.zeros(0, dtype=np.int32)
+    links = np.memmap(path, dtype=np.int32, mode="r")
+    return offsets, links
+
+
+def read_pages(store):
+    """
+    Return the page names of an edge store, in page id order.
+    """
+    with open(os.path.join(store, "pages.txt")) as f:
+        return f.read().splitlines()
+
+
+def out_of_core_pagerank(store, damping_factor, tolerance=1e-8, max_iterations=1000,
+                         chunk=EDGE_CHUNK):
+    """
+    Return PageRank values for the pages of an edge store, as a NumPy array
+    in page id order (see `read_pages`).
+
+    Each iteration streams over the memory-mapped edges `chunk` at a time,
+    so only the old and new rank vectors stay resident, however many edges
+    there are. Stops once the L1 change is below `tolerance`.
+    """
+    offsets, links = open_edge_store(store)
+    N = len(offsets) - 1
+
+    # Page ranges whose edges make up each chunk. The whole range [0, N]
+    # is always covered, even with no edges, so dangling pages are counted.
+    bounds = np.unique(np.concatenate([
+        [0], np.searchsorted(offsets, np.arange(0, offsets[-1], chunk), side="right") - 1, [N]
+    ]))
+
+    ranks = np.full(N, 1 / N)
+    for _ in range(max_iterations):
+        new_ranks = np.zeros(N)
+        dangling_rank = 0
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            page_offsets = np.asarray(offsets[start:end + 1])
+            degrees = np.diff(page_offsets)
+            dangling_rank += ranks[start:end][degrees == 0].sum()
+            shares = np.divide(ranks[start:end], degrees, out=np.zeros(end - start), where=degrees > 0)
+            targets = links[page_offsets[0]:page_offsets[-1]]
+            # Scatter in place, since a full-length bincount per chunk would cost O(N)
+            np.add.at(new_ranks, targets, np.repeat(shares, degrees))
+
+        new_ranks = (1 - damping_factor) / N + damping_factor * (new_ranks + dangling_rank / N)
+        residual = np.abs(new_ranks - ranks).sum()
+        ranks = new_ranks
+        if residual < tolerance:
+            break
+    return ranks
+
+
+class IncrementalPageRank():
+    """
+    PageRank for a corpus that changes a little at a time.
+
+    Keeps the link matrix, page index, dangling mask and last rank vector,
+    so that after pages or links are added or removed, only the columns of
+    pages whose links changed are rebuilt, and iteration restarts from the
+    old solution instead of from 1/N. Small edits only move ranks near the
+    edit much, so far fewer iterations are needed to converge again.
+    """
+
+    def __init__(self, corpus, damping_factor=DAMPING, tolerance=1e-8):
+        self.damping_factor = damping_factor
+        self.tolerance = tolerance
+        self.ranks = {}
+        self.iterations = 0
+        self.replace(corpus)
+
+    def update(self, added_pages=None, removed_pages=(), added_links=(), removed_links=()):
+        """
+        Apply changes to the corpus and return the new PageRank values.
+        `added_pages` maps new pages to their links, and links are
+        (page, linked page) pairs. As in `crawl`, links to pages outside
+        the corpus are ignored.
+        """
+        added_pages = added_pages or {}
+        removed = {page for page in removed_pages if page in self.index}
+        changed = set()
+
+        if removed:
+            # Links into removed pages go too. Their sources are the
+            # nonzero columns of the removed pages' rows.
+            rows = self.matrix[sorted(self.index[page] for page in removed)]
+            for source in set(rows.indices.tolist()):
+                page = self.pages[source]
+                if page not in removed:
+                    self.corpus[page] -= removed
+                    changed.add(page)
+
+            keep = np.ones(len(self.pages), dtype=bool)
+            keep[[self.index[page] for page in removed]] = False
+            for page in removed:
+                del self.corpus[page]
+            self.matrix = self.matrix[keep][:, keep]
+            self.dangling = self.dangling[keep]
+            self.vector = self.vector[keep]
+            self.pages = [page for page, kept in zip(self.pages, keep) if kept]
+            self.index = {page: i for i, page in enumerate(self.pages)}
+
+        # New pages go at the end, starting at 1/N
+        new = [page for page in added_pages if page not in self.index]
+        if new:
+            self.index.update((page, i) for i, page in enumerate(new, len(self.pages)))
+            self.pages.extend(new)
+            N = len(self.pages)
+            self.matrix.resize((N, N))
+            self.dangling = np.append(self.dangling, np.zeros(len(new), dtype=bool))
+            self.vector = np.append(self.vector, np.full(len(new), 1 / N))
+        for page, links in added_pages.items():
+            self.corpus[page] = set(links)
+            changed.add(page)
+
+        for page, link in removed_links:
+            if link in self.corpus.get(page, ()):
+                self.corpus[page].discard(link)
+                changed.add(page)
+        for page, link in added_links:
+            if page in self.corpus:
+                self.corpus[page].add(link)
+                changed.add(page)
+
+        if changed:
+            self.patch_columns(changed)
+        return self.solve()
+
+    def patch_columns(self, changed):
+        """
+        Rebuild the link matrix columns and dangling flags of the pages in
+        `changed` from their links in the corpus.
+        """
+        N = len(self.pages)
+        rows = []
+        columns = []
+        weights = []
+        for page in changed:
+            links = self.corpus[page] = set(
+                link for link in self.corpus[page]
+                if link in self.index and link != page
+            )
+            for link in links:
+                rows.append(self.index[link])
+                columns.append(self.index[page])
+                weights.append(1 / len(links))
+            self.dangling[self.index[page]] = not links
+
+        # Drop the old entries of those columns, then add the new ones
+        old = np.isin(self.matrix.indices, [self.index[page] for page in changed])
+        self.matrix.data[old] = 0
+        self.matrix.eliminate_zeros()
+        self.matrix = (self.matrix + sparse.csr_matrix((weights, (rows, columns)), shape=(N, N))).tocsr()
+
+    def replace(self, corpus):
+        """
+        Swap in a new version of the whole corpus, such as a fresh `crawl`
+        of the same directory, and return the new PageRank values.
+        """
+        self.corpus = {page: set(links) for page, links in corpus.items()}
+        self.pages, self.matrix, self.dangling = link_matrix(self.corpus)
+        self.index = {page: i for i, page in enumerate(self.pages)}
+
+        # Pages we have seen keep their old rank, new ones start at 1/N
+        N = len(self.pages)
+        self.vector = np.array([self.ranks.get(page, 1 / N) for page in self.pages])
+        return self.solve()
+
+    def solve(self):
+        """
+        Iterate to convergence, starting from the previous ranks,
+        and return the PageRank values.
+        """
+        ranks, self.iterations = power_iterate(
+            self.matrix, self.dangling, self.damping_factor,
+            self.vector / self.vector.sum(), self.tolerance
+        )
+        self.vector = ranks
+        self.ranks = dict(zip(self.pages, ranks.tolist()))
+        return self.ranks
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file